@@ -0,0 +1,77 @@
+# benchmarks/assisted.py
+"""Greedy decoding versus assisted decoding (prompt lookup and a draft model).
+
+    python benchmarks/assisted.py                                   # tiny random models, offline
+    python benchmarks/assisted.py --model Salesforce/codegen-350M-multi --draft Salesforce/codegen-350M-mono
+
+Every assisted output is compared with the plain greedy one; any mismatch is
+reported and makes the script exit non-zero.
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.tiny_model import build_tiny_model
+from generator.models import CodeGenModel
+from generator.prompts import function_prompt
+
+DESCRIPTIONS = [
+    "Write a function with signature: def add(a: int, b: int) -> int:\nReturn the sum of a and b.",
+    "Create a function named merge_sorted(left: list, right: list) -> list that merges two sorted lists",
+    "Write a function parse_iso_date(value: str) -> datetime that parses an ISO date string",
+    "Write a function named is_palindrome(text: str) -> bool that ignores case and spaces",
+]
+
+
+def run(cg, prompts, max_new_tokens):
+    texts, stats = [], []
+    start = time.perf_counter()
+    for prompt in prompts:
+        texts.append(cg.generate(prompt, max_new_tokens=max_new_tokens, temperature=0.0, top_p=1.0))
+        stats += cg.last_generation_stats()
+    return texts, stats, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", help="model name or path (default: tiny random model)")
+    parser.add_argument("--draft", help="draft model name or path (default: 1-layer tiny model)")
+    parser.add_argument("--lookup-tokens", type=int, default=10, help="prompt-lookup tokens per guess")
+    parser.add_argument("--max-new-tokens", type=int, default=128)
+    args = parser.parse_args()
+
+    cg = CodeGenModel(args.model or build_tiny_model())
+    draft = args.draft or (None if args.model else build_tiny_model(n_layer=1))
+    prompts = [function_prompt(d, "python") for d in DESCRIPTIONS]
+
+    run(cg, prompts[:1], 8)  # warm up
+    greedy, _, base = run(cg, prompts, args.max_new_tokens)
+    modes = [("prompt_lookup", dict(prompt_lookup_tokens=args.lookup_tokens))]
+    if draft:
+        modes.append(("draft", dict(draft=draft)))
+
+    print(f"{'mode':<15}{'seconds':>9}{'speedup':>9}{'accepted':>10}{'proposed':>10}{'accept %':>10}{'match':>7}")
+    print(f"{'greedy':<15}{base:>9.2f}{1.0:>8.2f}x{'-':>10}{'-':>10}{'-':>10}{'-':>7}")
+    mismatched = False
+    for name, kwargs in modes:
+        cg.set_assistant(draft=kwargs.get("draft"), prompt_lookup_tokens=kwargs.get("prompt_lookup_tokens", 0))
+        texts, stats, elapsed = run(cg, prompts, args.max_new_tokens)
+        accepted = sum(s["assisted"]["accepted"] for s in stats)
+        proposed = sum(s["assisted"]["proposed"] for s in stats)
+        match = sum(a == b for a, b in zip(texts, greedy))
+        mismatched |= match != len(greedy)
+        rate = 100 * accepted / proposed if proposed else 0.0
+        print(f"{name:<15}{elapsed:>9.2f}{base / elapsed:>8.2f}x{accepted:>10}{proposed:>10}{rate:>9.1f}%"
+              f"{match:>4}/{len(greedy)}")
+    cg.set_assistant(draft=None, prompt_lookup_tokens=0)
+
+    if mismatched:
+        print("MISMATCH: assisted output differs from greedy")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
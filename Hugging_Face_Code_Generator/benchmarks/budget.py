@@ -0,0 +1,107 @@
+# benchmarks/budget.py
+"""Fixed max_new_tokens=256 versus budgets learned by generator/budget.py.
+
+    python benchmarks/budget.py
+    python benchmarks/budget.py --requests 200 --token-delay 0.0005 --batch-size 8
+
+Uses a DummyModel that behaves like a model that does not stop on its own:
+it writes code whose length depends on the description and then keeps
+emitting filler until max_new_tokens runs out, at --token-delay seconds per
+token. Budgets are learned from --warmup requests first (persisted to a temp
+file), then the same workload runs through generate() and generate_batch()
+with the fixed default and with learned budgets. Reports tokens decoded,
+wall time, valid rate and the generator's own savings counters.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import CodeGenerator, DummyModel
+from generator.budget import TokenBudget
+
+TASKS = ["add two numbers", "check for a palindrome", "parse a date", "merge two sorted lists",
+         "count words in a file", "validate an email address", "compute a moving average", "flatten a nested list"]
+
+
+class RamblingModel(DummyModel):
+    """Code sized by the description, then filler to the end of the budget."""
+
+    def _complete(self, prompt):
+        description = prompt.rsplit("Description:", 1)[-1]
+        steps = description.count(" and ") + 1
+        body = "".join(f"    step_{i} = value * {i} + len(str(value))\n" for i in range(steps * 3))
+        return f"def solve(value):\n{body}    return value\n" + "# end of solution\n" * 400
+
+    def generate(self, prompt, max_new_tokens=256, **kwargs):
+        self.decoded += min(max_new_tokens, len(self._complete(prompt)) // 4)
+        return super().generate(prompt, max_new_tokens=max_new_tokens, **kwargs)
+
+    def generate_batch(self, prompts, max_new_tokens=256, batch_size=8, **kwargs):
+        step = max(1, batch_size)
+        for start in range(0, len(prompts), step):
+            chunk = prompts[start:start + step]
+            # every row decodes until the longest one in its micro-batch is done
+            self.decoded += len(chunk) * min(max_new_tokens, max(len(self._complete(p)) // 4 for p in chunk))
+        return super().generate_batch(prompts, max_new_tokens=max_new_tokens, batch_size=batch_size, **kwargs)
+
+
+def workload(n, seed):
+    rng = random.Random(seed)
+    return [" and ".join(rng.sample(TASKS, rng.randint(1, 4))).capitalize() for _ in range(n)]
+
+
+def run(budget, descriptions, token_delay, batch_size):
+    cg = CodeGenerator(cache=False, coalesce=False, similar=False, budget=budget)
+    cg.model = RamblingModel(token_delay=token_delay)
+    row = {}
+    for label, fn in (("generate", lambda: [cg.generate(d) for d in descriptions]),
+                      ("batch", lambda: cg.generate_batch(descriptions, batch_size=batch_size))):
+        cg.model.decoded = 0
+        start = time.perf_counter()
+        results = fn()
+        row[label] = {"s": time.perf_counter() - start, "tokens": cg.model.decoded,
+                      "valid": sum(r["valid"] and r["metrics"]["path"] != "fallback" for r in results) / len(results)}
+    cg.close()
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--token-delay", type=float, default=0.0002)
+    parser.add_argument("--batch-size", type=int, default=8)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="codegen-budget-"), "token_budgets.json")
+    learner = CodeGenerator(cache=False, coalesce=False, similar=False, budget=TokenBudget(path=path))
+    learner.model = RamblingModel(token_delay=0)
+    learner.model.decoded = 0
+    for d in workload(args.warmup, seed=1):
+        learner.generate(d)
+    learner.close()
+
+    descriptions = workload(args.requests, seed=2)
+    fixed = run(False, descriptions, args.token_delay, args.batch_size)
+    budget = TokenBudget(path=path)  # reloaded from disk, as a new process would
+    adaptive = run(budget, descriptions, args.token_delay, args.batch_size)
+
+    print(f"{len(descriptions)} requests, batch size {args.batch_size}, {args.token_delay * 1000:g} ms/token")
+    print(f"{'':<22}{'tokens':>9}{'wall s':>9}{'valid':>8}")
+    for name, row in (("fixed 256", fixed), ("learned budgets", adaptive)):
+        for label in ("generate", "batch"):
+            r = row[label]
+            print(f"{name + ' ' + label:<22}{r['tokens']:>9}{r['s']:>9.2f}{r['valid']:>8.1%}")
+    for label in ("generate", "batch"):
+        saved = 1 - adaptive[label]["tokens"] / fixed[label]["tokens"]
+        print(f"{label}: {saved:.1%} fewer tokens decoded, {fixed[label]['s'] - adaptive[label]['s']:.2f}s saved")
+    print("budget stats:", {k: v for k, v in budget.report().items() if k != "keys"})
+
+
+if __name__ == "__main__":
+    main()
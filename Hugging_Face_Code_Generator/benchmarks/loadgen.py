@@ -0,0 +1,188 @@
+# benchmarks/loadgen.py
+"""Replay a JSONL request log against CodeGenerator at a target load.
+
+    python benchmarks/loadgen.py ../requests.jsonl --rate 4 --requests 200 --token-delay 0.002
+    python benchmarks/loadgen.py ../requests.jsonl --concurrency 8 --requests 200 --token-delay 0.002
+    python benchmarks/loadgen.py ../requests.jsonl --sweep 2,4,8,16,32 --token-delay 0.002 --json
+
+Records look like requests.jsonl ({"title", "body"}) or {"description", "lang",
+"mode", "max_new_tokens"}; the log is cycled until --requests have been sent.
+Open loop (--rate, --sweep) issues requests at Poisson arrival times whatever
+the backlog, and latency counts from the scheduled arrival, so a stalled server
+shows up as queueing instead of being hidden. Closed loop (--concurrency) keeps
+N requests outstanding. Requests go through CodeGenerator.agenerate, whose
+executor runs --workers generations at a time.
+
+The default backend is DummyModel with --token-delay seconds per generated
+token, so scheduling can be studied without weights; --model runs a real one.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import CodeGenerator, DummyModel
+
+
+def load_log(path, lang, mode, max_new_tokens):
+    jobs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            description = record.get("description") or "\n".join(
+                p for p in (record.get("title"), record.get("body")) if p)
+            jobs.append((description, record.get("mode") or record.get("type") or mode, record.get("lang") or lang,
+                         int(record.get("max_new_tokens") or max_new_tokens)))
+    if not jobs:
+        raise ValueError(f"no requests in {path}")
+    return jobs
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(q / 100 * len(values) + 0.5)) - 1))]
+
+
+async def _request(cg, job, arrival, timeout, samples):
+    description, mode, lang, max_new_tokens = job
+    try:
+        result = await cg.agenerate(description, mode=mode, lang=lang, max_new_tokens=max_new_tokens, timeout=timeout)
+    except Exception as e:
+        samples.append({"latency": time.perf_counter() - arrival, "error": type(e).__name__})
+        return
+    latency = time.perf_counter() - arrival
+    service = (result.get("metrics") or {}).get("total_ms", 0) / 1000
+    samples.append({"latency": latency, "queue": max(0.0, latency - service), "error": None,
+                    "path": (result.get("metrics") or {}).get("path")})
+
+
+async def open_loop(cg, jobs, rate, n, timeout, seed=0):
+    rng = random.Random(seed)
+    samples, tasks = [], []
+    start = next_at = time.perf_counter()
+    for i in range(n):
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(_request(cg, jobs[i % len(jobs)], next_at, timeout, samples)))
+        next_at += rng.expovariate(rate)
+    sent = time.perf_counter() - start
+    await asyncio.gather(*tasks)
+    # a short Poisson run rarely hits the nominal rate exactly; judge throughput against what was sent
+    return samples, time.perf_counter() - start, n / sent if sent > 0 else rate
+
+
+async def closed_loop(cg, jobs, concurrency, n, timeout):
+    samples = []
+    counter = iter(range(n))
+
+    async def client():
+        for i in counter:
+            await _request(cg, jobs[i % len(jobs)], time.perf_counter(), timeout, samples)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return samples, time.perf_counter() - start
+
+
+def _round(value):
+    return None if value is None else round(value, 2)
+
+
+def summarize(samples, elapsed, offered=None):
+    ok = [s for s in samples if s["error"] is None]
+    lat = [s["latency"] * 1000 for s in ok]
+    queue = [s["queue"] * 1000 for s in ok]
+    errors = {}
+    for s in samples:
+        if s["error"] is not None:
+            errors[s["error"]] = errors.get(s["error"], 0) + 1
+    return {
+        "offered_rps": offered,
+        "requests": len(samples),
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed > 0 else None,
+        "latency_ms": {f"p{q}": _round(percentile(lat, q)) for q in (50, 95, 99)},
+        "queue_ms": {f"p{q}": _round(percentile(queue, q)) for q in (50, 95, 99)},
+        "error_rate": round(1 - len(ok) / len(samples), 4) if samples else 0.0,
+        "errors": errors,
+        "fallback_rate": round(sum(s["path"] == "fallback" for s in ok) / len(ok), 4) if ok else None,
+        "coalesced_rate": round(sum(s["path"] == "coalesced" for s in ok) / len(ok), 4) if ok else None,
+    }
+
+
+def _print_row(label, row):
+    lat, q = row["latency_ms"], row["queue_ms"]
+    print(f"{label:>10}{row['offered_rps'] or 0:>9.2f}{row['throughput_rps'] or 0:>9.2f}{lat['p50'] or 0:>9.1f}{lat['p95'] or 0:>9.1f}"
+          f"{lat['p99'] or 0:>9.1f}{q['p50'] or 0:>9.1f}{q['p99'] or 0:>9.1f}{row['error_rate']:>8.1%}"
+          f"{row['fallback_rate'] or 0:>10.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("log", help="JSONL request log")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--rate", type=float, help="open loop: mean arrivals per second (Poisson)")
+    load.add_argument("--concurrency", type=int, help="closed loop: requests kept outstanding")
+    load.add_argument("--sweep", help="open loop at each comma-separated rate, to find saturation")
+    parser.add_argument("--requests", type=int, default=100, help="requests per run")
+    parser.add_argument("--timeout", type=float, default=None, help="per-request deadline in seconds")
+    parser.add_argument("--workers", type=int, default=1, help="generations run at once (agenerate executor)")
+    parser.add_argument("--model", help="real model name or path (default: DummyModel)")
+    parser.add_argument("--token-delay", type=float, default=0.002, help="DummyModel seconds per token")
+    parser.add_argument("--lang", default="python")
+    parser.add_argument("--type", default="function")
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--cache", action="store_true", help="keep the result cache on (off by default)")
+    parser.add_argument("--no-coalesce", action="store_true", help="turn off joining identical in-flight requests")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    jobs = load_log(args.log, args.lang, args.type, args.max_new_tokens)
+    cg = CodeGenerator(args.model, cache=None if args.cache else False, coalesce=not args.no_coalesce,
+                       max_concurrency=args.workers)
+    if args.model is None:
+        cg.model = DummyModel(token_delay=args.token_delay)
+    else:
+        cg.model  # load before the clock starts
+
+    runs = []
+    try:
+        if args.concurrency:
+            samples, elapsed = asyncio.run(closed_loop(cg, jobs, args.concurrency, args.requests, args.timeout))
+            runs.append((f"c={args.concurrency}", summarize(samples, elapsed)))
+        else:
+            rates = [float(r) for r in args.sweep.split(",")] if args.sweep else [args.rate or 1.0]
+            for rate in rates:
+                samples, elapsed, offered = asyncio.run(open_loop(cg, jobs, rate, args.requests, args.timeout))
+                runs.append((f"{rate:g}/s", summarize(samples, elapsed, offered=round(offered, 3))))
+    finally:
+        cg.close()
+
+    # the most completions per second any run achieved; in a sweep, where throughput stops following the offer
+    report = {"runs": dict(runs), "saturation_rps": max((r["throughput_rps"] or 0) for _, r in runs)}
+    saturated = [label for label, r in runs if r["offered_rps"] and (r["throughput_rps"] or 0) < 0.9 * r["offered_rps"]]
+    report["saturated_at"] = saturated[0] if saturated else None
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{'load':>10}{'sent/s':>9}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'q50 ms':>9}{'q99 ms':>9}{'errors':>8}"
+          f"{'fallback':>10}")
+    for label, row in runs:
+        _print_row(label, row)
+    print(f"saturation throughput: {report['saturation_rps']:.2f} req/s"
+          + (f" (falls behind the offered load at {report['saturated_at']})" if report["saturated_at"] else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# benchmarks/precision.py
+"""Latency, memory and output validity per CPU precision mode.
+
+    python benchmarks/precision.py                          # tiny random model
+    python benchmarks/precision.py --model Salesforce/codegen-350M-multi --modes fp32,bf16,int8
+
+Every mode runs in a fresh process so load time and peak RSS are not skewed by
+the previous mode. Validity is the share of outputs that postprocess_and_format
+accepts without falling back to the deterministic stub.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DESCRIPTIONS = [
+    "Write a function that returns factorial",
+    "Write a function named is_prime that checks whether a number is prime",
+    "Write a function that reverses a string",
+    "Write a function that merges two sorted lists",
+    "Write a function that counts vowels in a string",
+    "Write a function that returns the nth Fibonacci number",
+]
+
+
+def _rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def worker(model, mode, max_new_tokens):
+    from generator.models import CodeGenModel
+    from main import CodeGenerator
+
+    start = time.perf_counter()
+    cg = CodeGenerator(model, dtype=mode, cache=False)
+    cg.model = CodeGenModel(model, device="cpu", dtype=mode)
+    load_s = time.perf_counter() - start
+    rss_after_load = _rss_mb()
+
+    latencies, valid = [], 0
+    for desc in DESCRIPTIONS:
+        t = time.perf_counter()
+        res = cg.generate(desc, max_new_tokens=max_new_tokens)
+        latencies.append(time.perf_counter() - t)
+        valid += res["metrics"]["path"] in ("model", "light_cleanup")
+    print(json.dumps({
+        "mode": mode, "load_s": load_s, "rss_after_load_mb": rss_after_load, "peak_rss_mb": _rss_mb(),
+        "p50_ms": statistics.median(latencies) * 1000, "mean_ms": statistics.mean(latencies) * 1000,
+        "validity": valid / len(DESCRIPTIONS),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precision mode benchmark")
+    parser.add_argument("--model", help="model name or path (default: tiny random model)")
+    parser.add_argument("--modes", default="fp32,bf16,int8")
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.model, args.worker, args.max_new_tokens)
+        return
+
+    if not args.model:
+        from benchmarks.tiny_model import build_tiny_model
+        args.model = build_tiny_model()
+
+    rows = []
+    for mode in args.modes.split(","):
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", mode, "--model", args.model,
+                               "--max-new-tokens", str(args.max_new_tokens)], capture_output=True, text=True)
+        lines = [ln for ln in proc.stdout.splitlines() if ln.startswith("{")]
+        if proc.returncode or not lines:
+            print(f"{mode}: failed\n{proc.stderr[-2000:]}")
+            continue
+        rows.append(json.loads(lines[-1]))
+
+    print(f"{'mode':<6}{'load s':>8}{'RSS MB':>9}{'peak MB':>9}{'p50 ms':>9}{'mean ms':>9}{'valid':>7}")
+    for r in rows:
+        print(f"{r['mode']:<6}{r['load_s']:>8.2f}{r['rss_after_load_mb']:>9.0f}{r['peak_rss_mb']:>9.0f}"
+              f"{r['p50_ms']:>9.1f}{r['mean_ms']:>9.1f}{r['validity']:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# benchmarks/prefix_cache.py
+"""Prefill time per prompt template with and without the KV prefix cache.
+
+    python benchmarks/prefix_cache.py                 # tiny random BPE model, offline
+    python benchmarks/prefix_cache.py --model Salesforce/codegen-350M-multi
+
+Exits non-zero if any template's prefix could not be reused, since that means
+every real request pays for a full prefill, or if the cached logits differ.
+"""
+import os
+import sys
+import copy
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.tiny_model import build_tiny_model
+from generator.models import CodeGenModel
+from generator.prompts import function_prompt, class_prompt, api_prompt, test_prompt, sql_prompt, prompt_prefix
+
+TEMPLATES = [
+    ("python", "function", function_prompt, ("python",)),
+    ("python", "class", class_prompt, ("python",)),
+    ("python", "api", api_prompt, ("python",)),
+    ("python", "test", test_prompt, ("python",)),
+    ("sql", "sql", sql_prompt, ()),
+]
+
+DESCRIPTIONS = [
+    "Write a function that returns factorial",
+    "Create a function named merge_sorted that merges two sorted lists",
+    "Return the top 5 users ordered by last_login",
+    "Parse an ISO date string and return a datetime",
+]
+
+
+def _time(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", help="model name or path (default: tiny random model)")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    import torch
+    # the tiny model merges spaces into words like a real BPE vocabulary, so boundary merges show up
+    cg = CodeGenModel(args.model or build_tiny_model(bpe_merges=True))
+    model, tok = cg.model, cg.tokenizer
+
+    bypassed = []
+    print(f"{'template':<18}{'prefix tok':>11}{'full ms':>10}{'cached ms':>11}{'speedup':>9}")
+    for lang, mode, builder, extra in TEMPLATES:
+        prefix = prompt_prefix(builder, *extra)
+        full_times, cached_times, n_prefix = [], [], 0
+        for desc in DESCRIPTIONS:
+            inputs = tok(builder(desc, *extra), return_tensors="pt").to(model.device)
+            prepared = cg._with_prefix(inputs, builder(desc, *extra), prefix)
+            if "past_key_values" not in prepared:
+                bypassed.append((f"{lang}/{mode}", desc))
+                continue
+            past = prepared["past_key_values"]
+            n_prefix = past.get_seq_length()
+            suffix = inputs["input_ids"][:, n_prefix:]
+
+            def full():
+                with torch.no_grad():
+                    model(**inputs, use_cache=True)
+
+            def cached():
+                with torch.no_grad():
+                    model(input_ids=suffix, past_key_values=copy.deepcopy(past), use_cache=True)
+
+            with torch.no_grad():
+                expected = model(**inputs).logits[0, -1]
+                got = model(input_ids=suffix, past_key_values=copy.deepcopy(past)).logits[0, -1]
+            if not torch.allclose(expected, got, atol=1e-4):
+                bypassed.append((f"{lang}/{mode} (logits differ)", desc))
+            full_times.append(_time(full, args.repeat))
+            cached_times.append(_time(cached, args.repeat))
+        if not full_times:
+            print(f"{lang + '/' + mode:<18}  prefix not reusable with this tokenizer")
+            continue
+        f_ms = statistics.mean(full_times) * 1000
+        c_ms = statistics.mean(cached_times) * 1000
+        print(f"{lang + '/' + mode:<18}{n_prefix:>11}{f_ms:>10.2f}{c_ms:>11.2f}{f_ms / c_ms:>8.2f}x")
+    print("prefix cache stats:", cg.prefix_cache.stats)
+    if bypassed:
+        for template, desc in bypassed:
+            print(f"FAILED {template}: {desc!r}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
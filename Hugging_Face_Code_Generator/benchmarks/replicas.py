@@ -0,0 +1,58 @@
+# benchmarks/replicas.py
+"""Throughput versus number of model replica processes.
+
+    python benchmarks/replicas.py --replicas 1,2,4 --items 32
+    python benchmarks/replicas.py --model Salesforce/codegen-350M-multi --replicas 1,4,8,16
+
+Each configuration splits the host's cores evenly between replicas
+(threads per replica = cores // replicas), so the best row is the split to use.
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.tiny_model import build_tiny_model
+from main import CodeGenerator
+
+
+def run(model, replicas, items, max_new_tokens, batch_size):
+    cg = CodeGenerator(model, cache=False, replicas=replicas if replicas > 1 else 0)
+    descriptions = [f"Write a function named f{i} that returns {i} times its argument" for i in range(items)]
+    try:
+        cg.generate_batch(descriptions[:replicas], max_new_tokens=max_new_tokens, batch_size=1)  # warm up
+        start = time.perf_counter()
+        results = cg.generate_batch(descriptions, max_new_tokens=max_new_tokens, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+    finally:
+        cg.close()
+    tokens = sum((r.get("metrics") or {}).get("output_tokens") or 0 for r in results)
+    return items / elapsed, tokens / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replica-count throughput benchmark")
+    parser.add_argument("--model", help="model name or path (default: tiny random model)")
+    parser.add_argument("--replicas", default="1,2,4", help="comma-separated replica counts")
+    parser.add_argument("--items", type=int, default=32)
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=1, help="prompts per job/forward pass")
+    args = parser.parse_args()
+
+    model = args.model or build_tiny_model()
+    cores = os.cpu_count() or 1
+    rows = []
+    for n in [int(x) for x in args.replicas.split(",")]:
+        items_s, tokens_s = run(model, n, args.items, args.max_new_tokens, args.batch_size)
+        rows.append((n, max(1, cores // n), items_s, tokens_s))
+
+    base = rows[0][2]
+    print(f"{'replicas':>8}{'threads':>9}{'items/s':>10}{'tokens/s':>11}{'speedup':>9}")
+    for n, threads, items_s, tokens_s in rows:
+        print(f"{n:>8}{threads:>9}{items_s:>10.2f}{tokens_s:>11.1f}{items_s / base:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
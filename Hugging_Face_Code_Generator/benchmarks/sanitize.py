@@ -0,0 +1,173 @@
+# benchmarks/sanitize.py
+"""sanitize_code: golden-output check against the previous implementation, and timings on large outputs.
+
+    python benchmarks/sanitize.py
+    python benchmarks/sanitize.py --fuzz 20000 --size 500 --repeat 5
+
+The golden corpus is a set of hand-picked edge cases (fences, CRLF and other
+line breaks, odd triple quotes, prose before code, separator lines) plus
+random compositions of them; every output must equal what the frozen copy of
+the old sanitize_code below returns. The timing part feeds multi-hundred-KB
+degenerate outputs, the kind a model stuck in a repetition loop produces at a
+large max_new_tokens. Exits non-zero on any difference.
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generator import formatter
+
+
+def legacy_sanitize(raw: str) -> str:
+    """sanitize_code as it was before the precompiled rewrite; do not edit."""
+    import re
+    m = re.search(r"```(?:python)?\n(.*?)```", raw, flags=re.S | re.I)
+    if m:
+        code = m.group(1)
+    else:
+        idxs = []
+        for pattern in [r"\ndef\s", r"\nclass\s", r"\nfrom\s", r"\nimport\s", r"^def\s", r"^class\s"]:
+            mm = re.search(pattern, raw, flags=re.I)
+            if mm:
+                idxs.append(mm.start())
+        if idxs:
+            start = min(idxs)
+            code = raw[start:].lstrip()
+        else:
+            code = raw
+
+    lines = code.splitlines()
+    cleaned_lines = []
+    prev = None
+    for ln in lines:
+        if ln.strip() == prev:
+            continue
+        cleaned_lines.append(ln)
+        prev = ln.strip()
+    code = "\n".join(cleaned_lines).strip()
+
+    if code.count('"""') % 2 == 1:
+        code = code.replace('"""', '')
+    if code.count("'''") % 2 == 1:
+        code = code.replace("'''", '')
+
+    code_lines = code.splitlines()
+    i = 0
+    while i < len(code_lines):
+        ln = code_lines[i].lstrip()
+        if ln.startswith(("def ", "class ", "import ", "from ", "@")) or re.match(r"[a-zA-Z_]\w*\s*=", ln):
+            break
+        i += 1
+    code = "\n".join(code_lines[i:]).strip()
+    return code
+
+
+def legacy_strip_separators(code: str) -> str:
+    lines = code.splitlines()
+    while lines and re.match(r"^[-._]{2,}$", lines[0].strip()):
+        lines.pop(0)
+    return "\n".join(lines).strip()
+
+
+GOLDEN = {
+    "plain_def": "def add(a, b):\n    return a + b\n",
+    "prose_then_def": "Here is the function you asked for:\n\ndef add(a, b):\n    return a + b\n\nHope it helps.",
+    "fenced": "Sure!\n```python\ndef add(a, b):\n    return a + b\n```\nExplanation follows.",
+    "fenced_upper": "```PYTHON\nx = 1\n```",
+    "fenced_other_lang": "```js\nfunction f() {}\n```\ndef g():\n    pass\n",
+    "fence_unclosed": "```python\ndef add(a, b):\n    return a + b\n",
+    "fence_four_ticks": "````\nclass A:\n    pass\n````",
+    "fence_second_block": "```js\nlet a = 1\n``` then ```\nb = 2\n```",
+    "import_first": "Some text\nimport os\nfrom sys import path\n\nprint(path)\n",
+    "leading_class": "class Person:\n    name: str\n",
+    "case_insensitive_start": "Words\nDEF not_really():\n    pass\n",
+    "crlf": "Text\r\ndef f():\r\n    return 1\r\n\r\n\r\ndef f():\r\n",
+    "other_breaks": "intro\x0cdef f():\x0b    return 1\u2028x = 2\x1cy = 3\x85z=4",
+    "unit_separator": "prose\n\x1fx = 1\n",
+    "nbsp_indent": "prose\n\xa0\xa0value = 3\n",
+    "duplicate_lines": "def f():\n    x = 1\n    x = 1\nx = 1\n\n\n\n    return x\n    return x\n",
+    "odd_triple_double": 'def f():\n    """Docstring that never ends\n    return 1\n',
+    "odd_triple_single": "def f():\n    '''start\n    return 1\n",
+    "quotes_recombine": "x = '''\ny = ''\"\"\"'\n",
+    "assign_across_lines": "prose\nvalue\n= 3\nz = 1\n",
+    "decorator": "Use this:\n@app.get('/health')\ndef health():\n    return {'ok': True}\n",
+    "only_prose": "I cannot help with that request.\nPlease clarify.",
+    "empty": "",
+    "whitespace": " \n\t\n ",
+    "separators": "---\n___\ndef f(:\n",
+    "unicode_identifier": "texte\nvariété = 1\n",
+    "def_without_space": "prose\ndefault = 1\ndef(x)\n",
+}
+
+FRAGMENTS = list(GOLDEN.values()) + [
+    "\n", "\r\n", "```", "```python\n", "\n```\n", '"""', "'''", "    ", "---\n", "x = 1\n",
+    "Explanation: the loop runs twice.\n", "return a + b\n", "def ", "class ", "\nimport re\n", "@",
+]
+
+
+def fuzz_corpus(n, seed=0):
+    rng = random.Random(seed)
+    return [("fuzz", "".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(1, 12)))) for _ in range(n)]
+
+
+def degenerate(size_kb):
+    """Large outputs from a model stuck in a loop (or never getting to code)."""
+    size = size_kb * 1024
+    fill = lambda unit: unit * (size // len(unit) + 1)  # noqa: E731
+    return {
+        "same line repeated": "def f():\n" + fill("    return compute(x)\n"),
+        "block repeated": "Here you go:\n" + fill("def f(x):\n    y = x + 1\n    return y\n\n"),
+        "prose, no code": fill("The function should be implemented carefully and tested.\n"),
+        "unclosed fences": fill("```javascript\nconsole.log(1)\n"),
+        "one long line": "x = [" + fill("1, "),
+        "odd triple quotes": 'def f():\n    """' + fill("    doc line with ''' inside\n    more text\n"),
+    }
+
+
+def best_time(fn, raw, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn(raw)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fuzz", type=int, default=5000, help="random compositions added to the golden corpus")
+    parser.add_argument("--size", type=int, default=300, help="KB per degenerate output")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    mismatches = []
+    for name, raw in list(GOLDEN.items()) + fuzz_corpus(args.fuzz):
+        expected = legacy_sanitize(raw)
+        if formatter.sanitize_code(raw) != expected:
+            mismatches.append((name, raw))
+        if formatter._strip_separators(expected) != legacy_strip_separators(expected):
+            mismatches.append((name + " (separators)", raw))
+    print(f"golden corpus: {len(GOLDEN) + args.fuzz} outputs, {len(mismatches)} mismatches")
+
+    print(f"{'degenerate output':<22}{'KB':>6}{'old ms':>10}{'new ms':>10}{'speedup':>9}")
+    for name, raw in degenerate(args.size).items():
+        old, expected = best_time(legacy_sanitize, raw, args.repeat)
+        new, got = best_time(formatter.sanitize_code, raw, args.repeat)
+        if got != expected:
+            mismatches.append((name, raw[:200]))
+        print(f"{name:<22}{len(raw) // 1024:>6}{old * 1000:>10.2f}{new * 1000:>10.2f}{old / new:>8.1f}x")
+
+    if mismatches:
+        for name, raw in mismatches[:10]:
+            print(f"MISMATCH {name}: {raw[:80]!r}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# benchmarks/similarity.py
+"""Near-duplicate cache: hit rate, false matches and lookup cost on paraphrased descriptions.
+
+    python benchmarks/similarity.py
+    python benchmarks/similarity.py --requests 5000 --threshold 0.7
+
+Each request is one of a set of distinct tasks, reworded the way users do it
+(case, punctuation, filler words, plurals). A hit is correct when the cached
+description belongs to the same task; anything else is a false match. Tasks
+that differ only in a name, number or argument order are included on purpose.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generator.similarity import SimilarityCache
+
+TASKS = [
+    "Create a factorial function",
+    "Write a function that checks whether a string is a palindrome",
+    "Convert celsius to fahrenheit",
+    "Convert fahrenheit to celsius",
+    "Return the top 5 users ordered by last_login",
+    "Return the top 10 users ordered by last_login",
+    "Write a function with signature: def add(a: int, b: int) -> int:",
+    "Write a function with signature: def add(x: int, y: int) -> int:",
+    "Create a class Person with name and age and a greet method",
+    "Create a class Animal with name and sound and a speak method",
+    "Expose a /health endpoint that returns status ok",
+    "Merge two sorted lists into one sorted list",
+    "Parse a CSV file and return the rows as dictionaries",
+    "Count the words in a text file",
+]
+
+
+def paraphrase(text, rng):
+    words = text.split()
+    if rng.random() < 0.5:
+        words = [w for w in words if w.lower() not in ("a", "the", "that")]
+    if rng.random() < 0.3:
+        words.insert(0, rng.choice(["Please", "please", "Just"]))
+    text = " ".join(words)
+    r = rng.random()
+    if r < 0.3:
+        text = text.lower()
+    elif r < 0.4:
+        text = text.upper()
+    if rng.random() < 0.5:
+        text += rng.choice([".", "!", "?", " ", "  ."])
+    return text.replace(" ", "  ") if rng.random() < 0.2 else text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--max-entries", type=int, default=2048)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    cache = SimilarityCache(threshold=args.threshold, max_entries=args.max_entries)
+    namespace = ("bench", "python", "function", 256)
+    hits = false = 0
+    lookup_s = []
+    for _ in range(args.requests):
+        task = rng.randrange(len(TASKS))
+        description = paraphrase(TASKS[task], rng)
+        start = time.perf_counter()
+        hit = cache.get(namespace, description, validate=lambda code: (True, "ok"))
+        lookup_s.append(time.perf_counter() - start)
+        if hit is None:
+            cache.put(namespace, description, {"formatted_code": f"# task {task}\n", "task": task})
+            continue
+        hits += 1
+        false += hit["result"]["task"] != task
+
+    lookup_s.sort()
+    print(f"{args.requests} requests over {len(TASKS)} tasks, threshold {args.threshold}")
+    print(f"hit rate        {hits / args.requests:.1%}  (ceiling {(args.requests - len(TASKS)) / args.requests:.1%})")
+    print(f"false matches   {false} ({false / max(hits, 1):.2%} of hits)")
+    print(f"entries         {cache.stats['entries']}")
+    print(f"lookup p50/p99  {lookup_s[len(lookup_s) // 2] * 1e6:.0f} / {lookup_s[int(len(lookup_s) * 0.99)] * 1e6:.0f} us")
+    if false:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# benchmarks/snapshot.py
+"""Time to first token from a cold process, before and after `cli.py prepare`.
+
+    python benchmarks/snapshot.py                      # small random model, offline
+    python benchmarks/snapshot.py --precision fp32 --layers 12 --embd 768
+
+Each sample is a fresh interpreter that imports CodeGenModel, loads the model
+and generates one token, timed from process start to that token. "import"
+covers torch, transformers and the model's modeling module, which cost the
+same on both paths.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.tiny_model import build_tiny_model
+
+CHILD = """
+import sys, time, json
+start = time.perf_counter()
+from generator.models import CodeGenModel
+import os, torch, transformers
+# import the model's own module up front: it costs the same either way and would swamp the load numbers
+if os.path.isdir(sys.argv[1]):
+    arch = json.load(open(os.path.join(sys.argv[1], "config.json"))).get("architectures") or []
+    [getattr(transformers, a) for a in arch]
+imported = time.perf_counter()
+m = CodeGenModel(sys.argv[1], device="cpu", dtype=sys.argv[2] or None)
+loaded = time.perf_counter()
+m.generate("def add(a, b):", max_new_tokens=1, temperature=0.0, top_p=1.0)
+done = time.perf_counter()
+print(json.dumps({"import_s": imported - start, "load_s": loaded - imported, "ttft_s": done - start}))
+"""
+
+
+def cold_start(model, precision, snapshot_dir, repeat):
+    env = dict(os.environ, CODEGEN_SNAPSHOT_DIR=snapshot_dir, HF_HUB_OFFLINE="1")
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-c", CHILD, model, precision or ""], cwd=ROOT, env=env,
+                              capture_output=True, text=True)
+        wall = time.perf_counter() - start
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr[-2000:])
+        row = json.loads(proc.stdout.strip().splitlines()[-1])
+        row["wall_s"] = wall
+        samples.append(row)
+    return {k: statistics.median(s[k] for s in samples) for k in samples[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", help="model name or path (default: small random model)")
+    parser.add_argument("--precision", default="bf16", help="fp32, bf16, fp16 or int8")
+    parser.add_argument("--layers", type=int, default=4, help="random model depth")
+    parser.add_argument("--embd", type=int, default=512, help="random model width")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    model = args.model or build_tiny_model(n_layer=args.layers, n_embd=args.embd, n_head=8)
+    snapshot_dir = tempfile.mkdtemp(prefix="codegen-snapshots-")
+    before = cold_start(model, args.precision, snapshot_dir, args.repeat)
+
+    prepare = subprocess.run([sys.executable, "cli.py", "prepare", "--model", model, "--precision", args.precision],
+                             cwd=ROOT, env=dict(os.environ, CODEGEN_SNAPSHOT_DIR=snapshot_dir, HF_HUB_OFFLINE="1"),
+                             capture_output=True, text=True)
+    if prepare.returncode != 0:
+        raise RuntimeError(prepare.stderr[-2000:])
+    after = cold_start(model, args.precision, snapshot_dir, args.repeat)
+
+    print(f"{'':<17}{'import ms':>10}{'load ms':>10}{'TTFT ms':>10}{'process ms':>12}")
+    for label, row in (("from_pretrained", before), ("snapshot", after)):
+        print(f"{label:<17}{row['import_s'] * 1000:>10.0f}{row['load_s'] * 1000:>10.0f}"
+              f"{row['ttft_s'] * 1000:>10.0f}{row['wall_s'] * 1000:>12.0f}")
+    print(f"load speedup: {before['load_s'] / after['load_s']:.2f}x, "
+          f"TTFT speedup: {before['ttft_s'] / after['ttft_s']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# benchmarks/startup.py
+"""Cold-start cost of the CLI entry points.
+
+Reports `-X importtime` totals for main/cli, the slowest imports, whether any
+heavy library got imported, and wall-clock time until the first line of output
+for the no-model paths. Exits non-zero if --max-ms is exceeded, so it can run
+as a regression check:
+
+    python benchmarks/startup.py --max-ms 500
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY = ("torch", "transformers", "black", "sqlparse", "pyjsparser")
+
+ENTRY_POINTS = {
+    "cli (no args)": [sys.executable, "cli.py"],
+    "main (no args)": [sys.executable, "main.py"],
+}
+
+
+def import_profile(module):
+    """Return (total_us, [(cumulative_us, name), ...]) from `python -X importtime`."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=ROOT, capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        parts = line.split("|")
+        rows.append((int(parts[1]), parts[2].rstrip()))
+    total = next((us for us, name in rows if name.strip() == module), 0)
+    return total, sorted(rows, reverse=True)
+
+
+def heavy_imports(module):
+    code = f"import sys, {module}; print(','.join(m for m in {HEAVY!r} if m in sys.modules))"
+    proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    out = proc.stdout.strip().splitlines()
+    return [m for m in (out[-1].split(",") if out else []) if m]
+
+
+def time_to_first_output(cmd, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        proc.stdout.readline()
+        samples.append(time.perf_counter() - start)
+        proc.communicate()
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CLI cold-start benchmark")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="show the N slowest imports")
+    parser.add_argument("--max-ms", type=float, default=None, help="fail if any time-to-first-output exceeds this")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = {"imports": {}, "first_output_ms": {}}
+    for module in ("main", "cli"):
+        total, rows = import_profile(module)
+        report["imports"][module] = {
+            "total_ms": round(total / 1000, 2),
+            "heavy": heavy_imports(module),
+            "slowest": [(name.strip(), round(us / 1000, 2)) for us, name in rows[1:args.top + 1]],
+        }
+    for label, cmd in ENTRY_POINTS.items():
+        report["first_output_ms"][label] = round(time_to_first_output(cmd, args.repeat), 1)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for module, info in report["imports"].items():
+            print(f"import {module}: {info['total_ms']} ms, heavy modules: {', '.join(info['heavy']) or 'none'}")
+            for name, ms in info["slowest"]:
+                print(f"    {ms:8.2f} ms  {name}")
+        for label, ms in report["first_output_ms"].items():
+            print(f"{label}: first output after {ms} ms")
+
+    failed = [label for label, ms in report["first_output_ms"].items() if args.max_ms and ms > args.max_ms]
+    failed += [f"import {m} pulled in {info['heavy']}" for m, info in report["imports"].items() if info["heavy"]]
+    if failed:
+        print("REGRESSION:", "; ".join(failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
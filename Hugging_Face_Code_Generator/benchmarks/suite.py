@@ -0,0 +1,261 @@
+# benchmarks/suite.py
+"""End-to-end benchmark of CodeGenerator, offline, with JSON output and regression checks.
+
+    python benchmarks/suite.py run -o baseline.json              # DummyModel + tiny random LM
+    python benchmarks/suite.py run -o current.json --backends dummy --quick
+    python benchmarks/suite.py compare baseline.json current.json --threshold 0.10
+
+Every backend runs in its own process so peak RSS is its own. Per backend it
+records per-stage latency (p50/p95 of Trace stages), throughput for several
+generate_batch sizes and thread concurrency levels, peak RSS, and the valid
+and fallback rates for every lang/mode combination. `compare` exits non-zero
+when a metric got worse by more than the threshold.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+LANGS = ["python", "javascript", "sql", "html_css"]
+MODES = ["function", "class", "api", "test"]
+DESCRIPTIONS = [
+    "Write a function with signature: def add(a: int, b: int) -> int:\nReturn the sum of a and b.",
+    "Create a class Person with name and age and a greet method",
+    "Return the top 5 users ordered by last_login from the users table",
+    "Expose a /health endpoint that returns status ok",
+]
+BATCH_SIZES = [1, 4, 8]
+CONCURRENCY = [1, 2, 4]
+
+
+def _percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {"p50": None, "p95": None}
+    return {"p50": round(statistics.median(values), 3),
+            "p95": round(values[min(len(values) - 1, int(0.95 * len(values)))], 3)}
+
+
+def _peak_rss_mb():
+    # VmHWM restarts at exec; ru_maxrss on Linux carries over the parent's peak
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    import resource
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _make_generator(backend, model_path):
+    from main import CodeGenerator, DummyModel
+    cg = CodeGenerator(model_path, cache=False, coalesce=False, replicas=0)
+    if backend == "dummy":
+        cg.model = DummyModel()
+    else:
+        cg.model  # load outside the timed sections
+    return cg
+
+
+def run_backend(backend, model_path, max_new_tokens, quick, repeat=3):
+    from concurrent.futures import ThreadPoolExecutor
+
+    cg = _make_generator(backend, model_path)
+    descriptions = DESCRIPTIONS[:2] if quick else DESCRIPTIONS
+    stages, totals, quality = {}, [], {}
+
+    for lang in LANGS:
+        for mode in MODES:
+            valid = fallback = 0
+            for d in descriptions:
+                r = cg.generate(d, mode=mode, lang=lang, max_new_tokens=max_new_tokens)
+                m = r["metrics"]
+                totals.append(m["total_ms"])
+                for stage, ms in m["stages_ms"].items():
+                    stages.setdefault(stage, []).append(ms)
+                valid += bool(r.get("valid"))
+                fallback += m.get("path") == "fallback"
+            quality[f"{lang}/{mode}"] = {"n": len(descriptions), "valid_rate": valid / len(descriptions),
+                                         "fallback_rate": fallback / len(descriptions)}
+
+    # DummyModel is fast enough that short runs are all noise
+    n_items = (8 if quick else 16) * (8 if backend == "dummy" else 1)
+    items = [f"{DESCRIPTIONS[0]} (variant {i})" for i in range(n_items)]
+    def best_rate(fn):
+        # best of a few runs: throughput noise is one-sided (other load only slows us down)
+        best = 0.0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            best = max(best, len(items) / (time.perf_counter() - start))
+        return round(best, 3)
+
+    batch = {}
+    for size in BATCH_SIZES:
+        batch[str(size)] = best_rate(lambda: cg.generate_batch(items, max_new_tokens=max_new_tokens, batch_size=size))
+
+    concurrency = {}
+    for workers in CONCURRENCY:
+        with ThreadPoolExecutor(workers) as ex:
+            concurrency[str(workers)] = best_rate(
+                lambda: list(ex.map(lambda d: cg.generate(d, max_new_tokens=max_new_tokens), items)))
+    cg.close()
+
+    n = sum(q["n"] for q in quality.values())
+    return {
+        "stages_ms": {stage: _percentiles(v) for stage, v in sorted(stages.items())},
+        "total_ms": _percentiles(totals),
+        "batch_items_per_s": batch,
+        "concurrency_items_per_s": concurrency,
+        "peak_rss_mb": _peak_rss_mb(),
+        "valid_rate": round(sum(q["valid_rate"] * q["n"] for q in quality.values()) / n, 4),
+        "fallback_rate": round(sum(q["fallback_rate"] * q["n"] for q in quality.values()) / n, 4),
+        "quality": quality,
+    }
+
+
+def cmd_worker(args):
+    result = run_backend(args.backend, args.model, args.max_new_tokens, args.quick)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+
+
+def cmd_run(args):
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    model_path = args.model
+    if "tiny" in backends and not model_path:
+        from benchmarks.tiny_model import build_tiny_model
+        model_path = build_tiny_model()
+
+    report = {"meta": {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                       "platform": platform.platform(), "cpus": os.cpu_count(),
+                       "max_new_tokens": args.max_new_tokens, "quick": args.quick},
+              "backends": {}}
+    for backend in backends:
+        out = tempfile.mktemp(suffix=".json")
+        cmd = [sys.executable, os.path.abspath(__file__), "worker", "--backend", backend, "--out", out,
+               "--max-new-tokens", str(args.max_new_tokens)] + (["--model", model_path] if backend != "dummy" else [])
+        cmd += ["--quick"] if args.quick else []
+        start = time.perf_counter()
+        proc = subprocess.run(cmd, cwd=ROOT, env=dict(os.environ, HF_HUB_OFFLINE="1"), capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"{backend} benchmark failed:\n{proc.stderr[-3000:]}")
+        with open(out, "r", encoding="utf-8") as f:
+            report["backends"][backend] = json.load(f)
+        os.remove(out)
+        print(f"[suite] {backend}: {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+def _flatten(node, prefix=""):
+    if isinstance(node, dict):
+        for k, v in node.items():
+            yield from _flatten(v, f"{prefix}.{k}" if prefix else k)
+    elif isinstance(node, (int, float)) and not isinstance(node, bool):
+        yield prefix, float(node)
+
+
+def _direction(key):
+    """+1 if higher is better, -1 if lower is better, 0 to ignore."""
+    if key.endswith(".n"):
+        return 0
+    if "_per_s" in key or key.endswith("valid_rate"):
+        return 1
+    if "_ms" in key or key.endswith("_mb") or key.endswith("fallback_rate"):
+        return -1
+    return 0
+
+
+def compare(baseline, current, threshold=0.20, rate_threshold=0.05, min_ms=1.0):
+    """List (metric, old, new, change) that regressed. Latencies under min_ms are
+    too noisy to judge; rates are compared in absolute terms."""
+    old = dict(_flatten(baseline.get("backends", {})))
+    regressions = []
+    for key, new in _flatten(current.get("backends", {})):
+        direction = _direction(key)
+        if direction == 0 or key not in old:
+            continue
+        before = old[key]
+        if key.endswith("_rate"):
+            worse = (before - new) * direction
+            if worse > rate_threshold:
+                regressions.append((key, before, new, -worse * direction))
+            continue
+        if "_ms" in key and max(before, new) < min_ms:
+            continue
+        if before <= 0:
+            continue
+        change = (new - before) / before
+        if -change * direction > threshold:
+            regressions.append((key, before, new, change))
+    return regressions
+
+
+def cmd_compare(args):
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, "r", encoding="utf-8") as f:
+        current = json.load(f)
+    regressions = compare(baseline, current, args.threshold, args.rate_threshold, args.min_ms)
+    if not regressions:
+        print(f"No regressions (threshold {args.threshold:.0%}).")
+        return
+    print(f"{len(regressions)} regression(s):")
+    for key, before, new, change in regressions:
+        shown = f"{change:+.3f}" if key.endswith("_rate") else f"{change:+.1%}"
+        print(f"  {key}: {before:g} -> {new:g} ({shown})")
+    sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="run the benchmarks and write JSON")
+    run.add_argument("-o", "--output", help="JSON file (default: stdout)")
+    run.add_argument("--backends", default="dummy,tiny", help="comma-separated: dummy, tiny")
+    run.add_argument("--model", help="model for the 'tiny' backend (default: a fresh tiny random LM)")
+    run.add_argument("--max-new-tokens", type=int, default=32)
+    run.add_argument("--quick", action="store_true", help="fewer descriptions and batch items")
+    run.set_defaults(fn=cmd_run)
+
+    worker = sub.add_parser("worker", help=argparse.SUPPRESS)
+    worker.add_argument("--backend", required=True)
+    worker.add_argument("--model")
+    worker.add_argument("--out", required=True)
+    worker.add_argument("--max-new-tokens", type=int, default=32)
+    worker.add_argument("--quick", action="store_true")
+    worker.set_defaults(fn=cmd_worker)
+
+    cmp = sub.add_parser("compare", help="flag regressions of CURRENT against BASELINE")
+    cmp.add_argument("baseline")
+    cmp.add_argument("current")
+    cmp.add_argument("--threshold", type=float, default=0.20, help="relative slowdown that counts (default 20%%)")
+    cmp.add_argument("--rate-threshold", type=float, default=0.05, help="absolute drop in valid/fallback rates")
+    cmp.add_argument("--min-ms", type=float, default=1.0, help="ignore latencies below this")
+    cmp.set_defaults(fn=cmd_compare)
+
+    args = parser.parse_args()
+    args.fn(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# benchmarks/tiny_model.py
+"""Build a tiny randomly initialised causal LM on disk so benchmarks run offline.
+
+The tokenizer is a byte-level GPT-2 tokenizer, which both the slow and fast
+GPT-2 tokenizer classes can load. By default it has no merges (one token per
+byte); with bpe_merges=True it also merges a space into the following letter
+or digit, as real BPE vocabularies do ("Ġw"), so tokens shift across a
+"Description: " boundary the way they do with CodeGen's tokenizer.
+"""
+import os
+import sys
+import json
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _byte_alphabet():
+    # GPT-2's reversible byte -> printable unicode mapping
+    bs = list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1)) + list(range(ord("®"), ord("ÿ") + 1))
+    cs = bs[:]
+    n = 0
+    for b in range(256):
+        if b not in bs:
+            bs.append(b)
+            cs.append(256 + n)
+            n += 1
+    return [chr(c) for c in cs]
+
+
+def build_tiny_model(path: str = None, n_layer: int = 2, n_embd: int = 64, n_head: int = 4,
+                     n_positions: int = 2048, seed: int = 0, bpe_merges: bool = False) -> str:
+    """Write config, weights and tokenizer files to `path` and return it."""
+    import torch
+    from transformers import GPT2Config, GPT2LMHeadModel
+
+    path = path or tempfile.mkdtemp(prefix="tiny-codegen-")
+    os.makedirs(path, exist_ok=True)
+
+    vocab = {ch: i for i, ch in enumerate(_byte_alphabet())}
+    merges = []
+    if bpe_merges:
+        for ch in "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789":
+            merges.append(f"\u0120 {ch}")
+            vocab[f"\u0120{ch}"] = len(vocab)
+    vocab["<|endoftext|>"] = len(vocab)
+    with open(os.path.join(path, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(vocab, f)
+    with open(os.path.join(path, "merges.txt"), "w", encoding="utf-8") as f:
+        f.write("#version: 0.2\n" + "".join(m + "\n" for m in merges))
+    with open(os.path.join(path, "tokenizer_config.json"), "w", encoding="utf-8") as f:
+        json.dump({"tokenizer_class": "GPT2Tokenizer", "bos_token": "<|endoftext|>",
+                   "eos_token": "<|endoftext|>", "unk_token": "<|endoftext|>"}, f)
+
+    torch.manual_seed(seed)
+    config = GPT2Config(vocab_size=len(vocab), n_positions=n_positions, n_embd=n_embd, n_layer=n_layer,
+                        n_head=n_head, bos_token_id=len(vocab) - 1, eos_token_id=len(vocab) - 1)
+    GPT2LMHeadModel(config).save_pretrained(path)
+    return path
+
+
+if __name__ == "__main__":
+    print(build_tiny_model(sys.argv[1] if len(sys.argv) > 1 else None))
@@ -0,0 +1,137 @@
+# benchmarks/validation.py
+"""Validation cost per snippet: the old per-call parsers versus generator/validator.py.
+
+    python benchmarks/validation.py
+    python benchmarks/validation.py --snippets 2000 --repeat 3
+
+The corpus mimics model output: DummyModel completions and JavaScript samples,
+cut off at random points (max_new_tokens), with stray fences and separator lines
+and with the duplicates a busy server sees. Exits non-zero if any verdict differs
+from the old validators.
+"""
+import os
+import re
+import sys
+import ast
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generator import validator
+
+PYTHON = [
+    "def add(a: int, b: int) -> int:\n    \"\"\"Return the sum of two integers.\"\"\"\n    return a + b\n",
+    "class Person:\n    def __init__(self, name: str, age: int):\n        self.name = name\n        self.age = age\n\n"
+    "    def greet(self) -> str:\n        return f'Hello, my name is {self.name}'\n",
+    "def test_add_positive():\n    assert add(1, 2) == 3\n\ndef test_add_zero():\n    assert add(0, 5) == 5\n",
+    "from fastapi import FastAPI\n\napp = FastAPI()\n\n@app.get('/health')\ndef health():\n"
+    "    return {'status': 'ok'}\n",
+    "def merge_sorted(left, right):\n    out, i, j = [], 0, 0\n    while i < len(left) and j < len(right):\n"
+    "        if left[i] <= right[j]:\n            out.append(left[i]); i += 1\n        else:\n"
+    "            out.append(right[j]); j += 1\n    return out + left[i:] + right[j:]\n",
+]
+
+JAVASCRIPT = [
+    "function add(a, b) {\n  return a + b;\n}\n",
+    "class Person {\n  constructor(name, age) {\n    this.name = name;\n    this.age = age;\n  }\n"
+    "  greet() {\n    return 'Hello, my name is ' + this.name;\n  }\n}\n",
+    "const express = require('express');\nconst app = express();\napp.get('/health', function (req, res) {\n"
+    "  res.json({ status: 'ok' });\n});\napp.listen(3000);\n",
+    "function mergeSorted(left, right) {\n  var out = [], i = 0, j = 0;\n  while (i < left.length && j < right.length) {\n"
+    "    out.push(left[i] <= right[j] ? left[i++] : right[j++]);\n  }\n  return out.concat(left.slice(i), right.slice(j));\n}\n",
+]
+
+
+def corpus(n, seed=0):
+    rng = random.Random(seed)
+    items = []
+    for _ in range(n):
+        lang = rng.choice(["python", "python", "javascript"])
+        code = rng.choice(PYTHON if lang == "python" else JAVASCRIPT) * rng.randint(1, 4)
+        r = rng.random()
+        if r < 0.3:
+            code = code[:rng.randint(1, len(code))]  # ran out of max_new_tokens
+        elif r < 0.4:
+            code = code + "```\n"
+        elif r < 0.5:
+            code = "---\n" + code
+        items.append((lang, code.strip()))
+    # duplicates: identical prompts produce identical greedy completions
+    items += [rng.choice(items) for _ in range(n // 2)]
+    rng.shuffle(items)
+    return items
+
+
+def legacy(lang, code):
+    """What postprocess_and_format/validate_js did before: fresh parser, cleanup re-parse."""
+    if lang == "javascript":
+        from pyjsparser import PyJsParser
+        try:
+            PyJsParser().parse(code)
+            return True
+        except Exception:
+            return False
+    try:
+        ast.parse(code)
+        return True
+    except SyntaxError:
+        lines = code.splitlines()
+        while lines and re.match(r"^[-._]{2,}$", lines[0].strip()):
+            lines.pop(0)
+        try:
+            ast.parse("\n".join(lines).strip())
+            return True
+        except SyntaxError:
+            return False
+
+
+def current(lang, code):
+    valid, _ = validator.validate(code, lang)
+    if valid or lang != "python":
+        return valid
+    lines = code.splitlines()
+    while lines and re.match(r"^[-._]{2,}$", lines[0].strip()):
+        lines.pop(0)
+    cleaned = "\n".join(lines).strip()
+    return cleaned != code and validator.validate(cleaned, lang)[0]
+
+
+def timed(fn, items, repeat, reset=None):
+    best = None
+    for _ in range(repeat):
+        if reset:
+            reset()
+        start = time.perf_counter()
+        out = [fn(lang, code) for lang, code in items]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--snippets", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    items = corpus(args.snippets)
+    base, expected = timed(legacy, items, args.repeat)
+    cold, got_cold = timed(current, items, args.repeat, reset=validator.clear_cache)
+    warm, got_warm = timed(current, items, args.repeat)
+
+    print(f"{len(items)} snippets ({sum(lang == 'javascript' for lang, _ in items)} JavaScript)")
+    print(f"{'':<22}{'total ms':>10}{'us/snippet':>12}{'speedup':>9}")
+    for label, t in (("old validators", base), ("cached, cold", cold), ("cached, warm", warm)):
+        print(f"{label:<22}{t * 1000:>10.1f}{t / len(items) * 1e6:>12.1f}{base / t:>8.1f}x")
+    print("validator stats:", validator.stats)
+
+    mismatches = sum(a != b for a, b in zip(expected, got_cold)) + sum(a != b for a, b in zip(expected, got_warm))
+    if mismatches:
+        print(f"MISMATCH: {mismatches} verdicts differ from the old validators")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,187 @@
 # cli.py
 import argparse
+import json
+import os
+import sys
+import time
 from main import CodeGenerator
 
+
+def _iter_records(path):
+    """Yield (line_no, record, error) from a JSONL file or stdin ("-"), one line at a time.
+
+    A line that is not a JSON object comes back as record None with the reason in `error`."""
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    try:
+        for line_no, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_no, None, f"invalid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield line_no, None, f"expected a JSON object, got {type(record).__name__}"
+                continue
+            yield line_no, record, None
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def _description(record):
+    # records may be plain {"description": ...} or shaped like requests.jsonl ({"title", "body"})
+    if record.get("description"):
+        return record["description"]
+    return "\n".join(p for p in (record.get("title"), record.get("body")) if p)
+
+
+def _load_checkpoint(path):
+    # None when there is no usable checkpoint
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_checkpoint(path, state):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def run_batch(argv):
+    parser = argparse.ArgumentParser(prog="cli.py batch", description="Generate code for every record of a JSONL file")
+    parser.add_argument("input", help="JSONL file, or - for stdin")
+    parser.add_argument("-o", "--output", required=True, help="JSONL file results are appended to")
+    parser.add_argument("--lang", default="python", help="default when a record has no lang")
+    parser.add_argument("--type", default="function", help="default when a record has no mode")
+    parser.add_argument("--max-new-tokens", type=int, default=None,
+                        help="default when a record has none (256, or learned with CODEGEN_ADAPTIVE_BUDGET=1)")
+    parser.add_argument("--batch-size", type=int, default=8, help="prompts per model forward pass")
+    parser.add_argument("--window", type=int, default=64, help="records read, grouped and written per step")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="ignore an existing checkpoint and start over, appending to the output")
+    args = parser.parse_args(argv)
+
+    ckpt_path = args.output + ".ckpt"
+    resumed = None if args.no_resume else _load_checkpoint(ckpt_path)
+    state = resumed or {"records_done": 0, "output_bytes": 0}
+    if state["records_done"]:
+        print(f"Resuming after {state['records_done']} records", file=sys.stderr)
+
+    out = open(args.output, "a+b")
+    if resumed is not None:
+        # drop anything written after the last checkpoint (a window interrupted mid-write); without one
+        # the output is not ours to cut, so results are appended to whatever it holds
+        out.truncate(state["output_bytes"])
+    out.seek(0, os.SEEK_END)
+
+    cg = CodeGenerator()
+    items = tokens = errors = 0
+    started = time.perf_counter()
+
+    def flush(window):
+        nonlocal items, tokens, errors
+        # one generate_batch call per (lang, mode, max_new_tokens) group, written back in input order;
+        # bad records and failed groups get an {"id", "error"} line so the run (and a resume) carries on
+        groups = {}
+        results = [None] * len(window)
+        descriptions = [None] * len(window)
+        for pos, (_, rec, error) in enumerate(window):
+            if error is not None:
+                results[pos] = {"error": error}
+                continue
+            max_new_tokens = rec.get("max_new_tokens", args.max_new_tokens)
+            try:
+                key = (rec.get("lang", args.lang), rec.get("mode", args.type),
+                       int(max_new_tokens) if max_new_tokens is not None else None)
+                descriptions[pos] = _description(rec)
+            except (TypeError, ValueError) as e:
+                results[pos] = {"error": f"invalid record: {e}"}
+                continue
+            groups.setdefault(key, []).append(pos)
+        for (lang, mode, max_new_tokens), positions in groups.items():
+            try:
+                outs = cg.generate_batch([descriptions[p] for p in positions], mode=mode, lang=lang,
+                                         max_new_tokens=max_new_tokens, batch_size=args.batch_size)
+            except Exception as e:
+                print(f"Generation failed for {len(positions)} records ({lang}/{mode}): {e!r}", file=sys.stderr)
+                outs = [{"error": f"generation failed: {e!r}"}] * len(positions)
+            for p, res in zip(positions, outs):
+                results[p] = res
+        for (line_no, rec, _), res in zip(window, results):
+            rec_id = line_no if rec is None else rec.get("id", rec.get("request_id", line_no))
+            out.write((json.dumps(dict(res, id=rec_id), ensure_ascii=False) + "\n").encode("utf-8"))
+            tokens += (res.get("metrics") or {}).get("output_tokens") or 0
+            errors += "error" in res
+        out.flush()
+        os.fsync(out.fileno())
+        items += len(window)
+        state["records_done"] += len(window)
+        state["output_bytes"] = out.tell()
+        _save_checkpoint(ckpt_path, state)
+
+    window = []
+    resume_from = state["records_done"]
+    try:
+        for n, item in enumerate(_iter_records(args.input)):
+            if n < resume_from:
+                continue
+            window.append(item)
+            if len(window) >= args.window:
+                flush(window)
+                window = []
+        if window:
+            flush(window)
+    finally:
+        out.close()
+        cg.close()
+
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    print(f"Processed {items} records in {elapsed:.2f}s: {items / elapsed:.2f} items/s, "
+          f"{tokens / elapsed:.1f} tokens/s, {errors} errors", file=sys.stderr)
+
+
+def run_prepare(argv):
+    parser = argparse.ArgumentParser(prog="cli.py prepare",
+                                     description="Convert a model once into a fast-loading local snapshot")
+    parser.add_argument("--model", default=CodeGenerator.DEFAULT_MODEL, help="defaults to CODEGEN_MODEL")
+    parser.add_argument("--precision", default=os.getenv("CODEGEN_PRECISION"), help="fp32, bf16, fp16 or int8")
+    parser.add_argument("--output", help="snapshot directory (default: under CODEGEN_SNAPSHOT_DIR, found automatically)")
+    args = parser.parse_args(argv)
+
+    from generator.snapshot import prepare_snapshot
+    print(prepare_snapshot(args.model, dtype=args.precision, output=args.output))
+
+
 def main():
-    parser = argparse.ArgumentParser()
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        run_batch(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "prepare":
+        run_prepare(sys.argv[2:])
+        return
+
+    parser = argparse.ArgumentParser(epilog="Use 'cli.py batch -h' for bulk JSONL jobs and 'cli.py prepare -h' "
+                                            "to build a fast-loading model snapshot.")
     parser.add_argument("description", type=str, nargs="?")
     parser.add_argument("--lang", default="python")
     parser.add_argument("--type", default="function")
     parser.add_argument("--demo", action="store_true")
     args = parser.parse_args()
 
+    if not args.demo and not args.description:
+        print("Provide a description or use --demo")
+        return
+
+    # the model itself loads lazily on the first generate call
     cg = CodeGenerator()
 
     if args.demo:
@@ -17,10 +189,6 @@ def main():
         cg.generate("Write a Python function that adds two numbers.", mode="function", lang="python")
         return
 
-    if not args.description:
-        print("Provide a description or use --demo")
-        return
-
     res = cg.generate(args.description, mode=args.type, lang=args.lang)
     print(res["formatted_code"])
 
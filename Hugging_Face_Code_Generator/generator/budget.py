@@ -0,0 +1,142 @@
+# generator/budget.py
+import os
+import json
+import math
+import threading
+
+# max_new_tokens used until a (model, lang, mode) has enough history, and the most a budget can save
+DEFAULT_MAX_NEW_TOKENS = 256
+BUDGET_PATH = os.getenv("CODEGEN_BUDGET_PATH") or os.path.join(os.path.expanduser("~"), ".cache", "codegen",
+                                                               "token_budgets.json")
+BUDGET_QUANTILE = float(os.getenv("CODEGEN_BUDGET_QUANTILE", "0.95") or 0.95)
+# set CODEGEN_ADAPTIVE_BUDGET=1 to learn budgets in every CodeGenerator
+ADAPTIVE_BUDGET = os.getenv("CODEGEN_ADAPTIVE_BUDGET", "0") not in ("", "0", "false", "False")
+
+
+def _size_class(description):
+    # longer descriptions tend to ask for more code; powers of two keep the classes few
+    return max(1, len(description.split())).bit_length()
+
+
+class TokenBudget:
+    """Per-request max_new_tokens learned from the length of accepted outputs.
+
+    For every (model, lang, mode) it keeps the last `window` token lengths of
+    sanitized code that passed validation, together with a size class of the
+    description, and persists them as JSON at `path` (None keeps them in
+    memory). A budget is the `quantile` of those lengths times `headroom`,
+    rounded up to a multiple of `step` and clamped to [floor, ceiling]; the size
+    class is used when it alone has min_samples. Before that, predict() returns
+    `default`. An output that was cut off by its budget and rejected is recorded
+    as twice the budget (at most the default), so budgets that turn out too small
+    grow back quickly; only accepted outputs can push a budget past the default.
+    """
+
+    def __init__(self, path: str = BUDGET_PATH, quantile: float = BUDGET_QUANTILE, headroom: float = 1.25,
+                 min_samples: int = 20, window: int = 256, default: int = DEFAULT_MAX_NEW_TOKENS, floor: int = 32,
+                 ceiling: int = 1024, step: int = 16, save_every: int = 32):
+        self.path = path
+        self.quantile = quantile
+        self.headroom = headroom
+        self.min_samples = min_samples
+        self.window = window
+        self.default = default
+        self.floor = floor
+        self.ceiling = ceiling
+        self.step = step
+        self.save_every = save_every
+        self._samples = {}  # "model|lang|mode" -> [[size class, tokens], ...], oldest first
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        self.stats = {"predicted": 0, "learned": 0, "recorded": 0, "truncated": 0, "hit_budget": 0,
+                      "tokens_budgeted": 0, "tokens_saved": 0, "latency_saved_s": 0.0}
+        self._load()
+
+    @staticmethod
+    def _key(model, lang, mode):
+        return f"{model}|{lang}|{mode}"
+
+    def _load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._samples = {k: [list(s) for s in v][-self.window:] for k, v in data.get("samples", {}).items()}
+        except (OSError, ValueError, AttributeError, TypeError):
+            self._samples = {}
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = json.dumps({"version": 1, "samples": self._samples})
+            self._unsaved = 0
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"[budget] Could not save token budgets to {self.path}: {e}")
+
+    def _quantile(self, values):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(math.ceil(self.quantile * len(values))) - 1)]
+
+    def predict(self, model, lang, mode, description=""):
+        """max_new_tokens for one request."""
+        size = _size_class(description)
+        with self._lock:
+            samples = self._samples.get(self._key(model, lang, mode), ())
+            same_size = [t for s, t in samples if s == size]
+            lengths = same_size if len(same_size) >= self.min_samples else [t for _, t in samples]
+            self.stats["predicted"] += 1
+            if len(lengths) < self.min_samples:
+                self.stats["tokens_budgeted"] += self.default
+                return self.default
+            budget = self._quantile(lengths) * self.headroom
+            budget = int(min(self.ceiling, max(self.floor, math.ceil(budget / self.step) * self.step)))
+            self.stats["learned"] += 1
+            self.stats["tokens_budgeted"] += budget
+            return budget
+
+    def record(self, model, lang, mode, description, tokens, budget=None, new_tokens=None, decode_s=None,
+               accepted=True):
+        """Note the sanitized token length of one output generated with max_new_tokens=budget.
+
+        new_tokens/decode_s are what the model reports, if anything. A generation
+        that stopped at its budget is counted as truncated when its output was
+        not accepted, and otherwise as tokens (and decode time) saved against
+        the fixed default.
+        """
+        hit_budget = budget is not None and (new_tokens if new_tokens is not None else tokens) >= budget
+        if hit_budget and not accepted:
+            tokens = min(self.default, budget * 2)
+        elif not accepted:
+            return
+        with self._lock:
+            samples = self._samples.setdefault(self._key(model, lang, mode), [])
+            samples.append([_size_class(description), int(tokens)])
+            del samples[:-self.window]
+            self.stats["recorded"] += 1
+            if hit_budget:
+                self.stats["hit_budget"] += 1
+                if not accepted:
+                    self.stats["truncated"] += 1
+                elif budget < self.default:
+                    self.stats["tokens_saved"] += self.default - budget
+                    if decode_s and new_tokens:
+                        self.stats["latency_saved_s"] += (self.default - budget) * decode_s / new_tokens
+            self._unsaved += 1
+            due = self._unsaved >= self.save_every
+        if due:
+            self.save()
+
+    def report(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["keys"] = {k: len(v) for k, v in self._samples.items()}
+        stats["latency_saved_s"] = round(stats["latency_saved_s"], 3)
+        return stats
@@ -0,0 +1,125 @@
+# generator/cache.py
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+CACHE_PATH = os.getenv("CODEGEN_CACHE_PATH")  # optional SQLite file for the persistent tier
+CACHE_MAX_ENTRIES = int(os.getenv("CODEGEN_CACHE_MAX_ENTRIES", "1024"))
+CACHE_MAX_AGE = float(os.getenv("CODEGEN_CACHE_MAX_AGE", "0") or 0)  # seconds, 0 = never expire
+
+
+def make_key(model_name, prompt, lang, mode, max_new_tokens, precision=None):
+    """Content address for a deterministic generation.
+
+    The full built prompt is hashed (not just the description), so editing a
+    template in generator/prompts.py changes every affected key. precision is
+    part of it because fp16/bf16/int8 weights can decode different tokens.
+    """
+    payload = json.dumps([model_name, prompt, lang, mode, max_new_tokens, precision], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """In-memory LRU of generation results with an optional SQLite tier.
+
+    Entries older than max_age seconds are treated as misses and removed.
+    Each tier holds at most max_entries / max_disk_entries results and drops
+    the least recently used ones first.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = CACHE_MAX_ENTRIES,
+                 max_age: float = CACHE_MAX_AGE, max_disk_entries: int = None):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.max_disk_entries = max_disk_entries or max_entries * 16
+        self._mem = OrderedDict()  # key -> (created_at, value)
+        self._lock = threading.Lock()
+        self._db = None
+        self.stats = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0, "evictions": 0, "expired": 0}
+        if path:
+            import sqlite3
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def _expired(self, created_at, now):
+        return bool(self.max_age) and now - created_at > self.max_age
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                if self._expired(entry[0], now):
+                    del self._mem[key]
+                    self.stats["expired"] += 1
+                else:
+                    self._mem.move_to_end(key)
+                    self.stats["hits"] += 1
+                    self.stats["memory_hits"] += 1
+                    return dict(entry[1])
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value, created_at FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    if self._expired(row[1], now):
+                        self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                        self._db.commit()
+                        self.stats["expired"] += 1
+                    else:
+                        self._db.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+                        self._db.commit()
+                        value = json.loads(row[0])
+                        self._put_mem(key, row[1], value)
+                        self.stats["hits"] += 1
+                        self.stats["disk_hits"] += 1
+                        return dict(value)
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key, value: dict):
+        now = time.time()
+        value = dict(value)
+        with self._lock:
+            self._put_mem(key, now, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), now, now),
+                )
+                count = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+                if count > self.max_disk_entries:
+                    self._db.execute(
+                        "DELETE FROM results WHERE key IN "
+                        "(SELECT key FROM results ORDER BY accessed_at ASC LIMIT ?)",
+                        (count - self.max_disk_entries,),
+                    )
+                    self.stats["evictions"] += count - self.max_disk_entries
+                self._db.commit()
+
+    def _put_mem(self, key, created_at, value):
+        self._mem[key] = (created_at, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM results")
+                self._db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,299 @@
+# generator/format_pool.py
+import os
+import json
+import queue
+import shutil
+import threading
+import subprocess
+import itertools
+
+FORMAT_TIMEOUT = float(os.getenv("CODEGEN_FORMAT_TIMEOUT", "10"))
+FORMAT_WORKERS = int(os.getenv("CODEGEN_FORMAT_WORKERS", "0") or 0) or (os.cpu_count() or 1)
+
+# Long-lived prettier process: one JSON request per stdin line, one JSON reply per stdout line.
+_NODE_SCRIPT = r"""
+const readline = require('readline');
+let prettier = null, loadError = null;
+try { prettier = require('prettier'); } catch (e) { loadError = String(e); }
+const rl = readline.createInterface({ input: process.stdin });
+rl.on('line', async (line) => {
+  let req;
+  try { req = JSON.parse(line); } catch (e) { return; }
+  let res;
+  if (!prettier) {
+    res = { id: req.id, error: loadError };
+  } else {
+    try {
+      res = { id: req.id, code: await prettier.format(req.code, { parser: req.parser || 'babel' }) };
+    } catch (e) {
+      res = { id: req.id, error: String(e) };
+    }
+  }
+  process.stdout.write(JSON.stringify(res) + '\n');
+});
+"""
+
+
+def _prettier_node_path():
+    """node_modules directory of a globally installed prettier CLI, if any."""
+    exe = shutil.which("prettier")
+    if not exe:
+        return None
+    real = os.path.realpath(exe)
+    # .../node_modules/prettier/bin/prettier.cjs -> .../node_modules
+    parts = real.split(os.sep)
+    if "node_modules" in parts:
+        idx = len(parts) - 1 - parts[::-1].index("node_modules")
+        return os.sep.join(parts[:idx + 1])
+    return None
+
+
+class NodeFormatterWorker:
+    """One persistent `node` process running prettier, restarted if it dies or hangs."""
+
+    def __init__(self):
+        self._proc = None
+        self._replies = None
+        self._ids = itertools.count()
+        self.restarts = 0
+        self.available = shutil.which("node") is not None
+
+    def _start(self):
+        env = dict(os.environ)
+        node_path = _prettier_node_path()
+        if node_path:
+            env["NODE_PATH"] = os.pathsep.join(p for p in (node_path, env.get("NODE_PATH")) if p)
+        self._proc = subprocess.Popen(
+            ["node", "-e", _NODE_SCRIPT],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, encoding="utf-8", bufsize=1, env=env,
+        )
+        self._replies = queue.Queue()
+        threading.Thread(target=self._read, args=(self._proc, self._replies), daemon=True).start()
+
+    @staticmethod
+    def _read(proc, replies):
+        for line in proc.stdout:
+            replies.put(line)
+        replies.put(None)  # EOF: the process exited
+
+    def _restart(self):
+        self.close()
+        self.restarts += 1
+
+    def format(self, code: str, parser: str = "babel", timeout: float = FORMAT_TIMEOUT):
+        """Return formatted code, or None if prettier is unavailable, failed or timed out."""
+        if not self.available:
+            return None
+        try:
+            if self._proc is None or self._proc.poll() is not None:
+                self._start()
+            req_id = next(self._ids)
+            self._proc.stdin.write(json.dumps({"id": req_id, "code": code, "parser": parser}) + "\n")
+            self._proc.stdin.flush()
+            while True:
+                line = self._replies.get(timeout=timeout)
+                if line is None:
+                    self._restart()
+                    return None
+                reply = json.loads(line)
+                if reply.get("id") == req_id:
+                    return reply.get("code")
+        except FileNotFoundError:
+            self.available = False
+            return None
+        except (queue.Empty, OSError, ValueError):
+            self._restart()
+            return None
+
+    def close(self):
+        if self._proc is not None:
+            try:
+                self._proc.kill()
+                self._proc.wait(timeout=1)
+            except Exception:
+                pass
+            self._proc = None
+
+
+class FormatterPool:
+    """Persistent formatter workers shared by the whole process.
+
+    JavaScript goes to a few long-lived prettier processes; black and sqlparse
+    run in a process pool so bulk post-processing uses every core. Anything that
+    fails or times out falls back to returning the input unchanged. Items whose
+    worker died are redone in-process, and a pool that cannot run at all (a
+    spawn pool started from `python -` or a script without a __main__ guard)
+    is switched off for good, so every later call formats in-process.
+    """
+
+    def __init__(self, workers: int = FORMAT_WORKERS, node_workers: int = None, timeout: float = FORMAT_TIMEOUT):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self._node_idle = queue.Queue()
+        for _ in range(node_workers or min(2, self.workers)):
+            self._node_idle.put(NodeFormatterWorker())
+        self._executor = None
+        self._lock = threading.Lock()
+        self.usable = True
+
+    def format_js(self, code: str) -> str:
+        worker = self._node_idle.get()
+        try:
+            out = worker.format(code, timeout=self.timeout)
+        finally:
+            self._node_idle.put(worker)
+        return code if out is None else out
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                # spawn, not fork: the parent usually has torch threads running
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def _reset_executor(self, kill=False):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        # shutdown() leaves running jobs alone, so a hung black/sqlparse call would keep its worker
+        # busy for good; kill=True terminates the workers, like NodeFormatterWorker does with node
+        procs = list((getattr(executor, "_processes", None) or {}).values()) if kill else []
+        executor.shutdown(wait=False, cancel_futures=True)
+        for proc in procs:
+            try:
+                proc.kill()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _run_local(fn, item, fallback):
+        try:
+            return fn(*item)
+        except Exception:
+            return fallback(item)
+
+    def _submit(self, fn, items):
+        """Futures for every item, or None when the work should run in-process."""
+        if self.workers <= 1 or len(items) < 2 or not self.usable:
+            return None
+        from concurrent.futures.process import BrokenProcessPool
+        try:
+            executor = self._get_executor()
+            return [executor.submit(fn, *item) for item in items]
+        except (BrokenProcessPool, OSError) as e:
+            self._disable(e)
+            return None
+
+    def _disable(self, error):
+        if self.usable:
+            print(f"[format_pool] Process pool unusable ({error!r}); formatting in-process from now on")
+        self.usable = False
+        self._reset_executor()
+
+    def _after_break(self, error, delivered, timed_out):
+        # a pool that broke before returning anything never started; one that ran jobs just lost a worker
+        if error is not None and not delivered:
+            self._disable(error)
+        elif error is not None or timed_out:
+            self._reset_executor(kill=timed_out)
+
+    def map(self, fn, items, fallback):
+        """Run fn(*item) for every item across the process pool, keeping order.
+
+        `fallback(item)` supplies the result for items that raise or time out.
+        Items that lose their worker are run in-process; a crashed pool, or one
+        with a timed-out job, is replaced for the next call.
+        """
+        items = list(items)
+        futures = self._submit(fn, items)
+        if futures is None:
+            return [self._run_local(fn, item, fallback) for item in items]
+
+        from concurrent.futures.process import BrokenProcessPool
+        out, broken, timed_out, delivered = [], None, False, 0
+        for item, fut in zip(items, futures):
+            try:
+                out.append(fut.result(timeout=self.timeout))
+                delivered += 1
+            except BrokenProcessPool as e:
+                # the worker died, not necessarily because of this item
+                broken = e
+                out.append(self._run_local(fn, item, fallback))
+            except TimeoutError:
+                timed_out = True
+                out.append(fallback(item))
+            except Exception:
+                delivered += 1
+                out.append(fallback(item))
+        self._after_break(broken, delivered, timed_out)
+        return out
+
+    def first(self, fn, items, accept, fallback):
+        """Run fn(*item) across the pool until one result satisfies accept(result).
+
+        Returns (index, result, results) where results maps every finished item
+        index to its result; (None, None, results) if nothing was accepted. Once
+        a winner is found, items that have not started yet are cancelled; if
+        the timeout passes first, the pool is replaced for the next call.
+        """
+        items = list(items)
+        results = {}
+        submitted = self._submit(fn, items)
+        if submitted is None:
+            for i, item in enumerate(items):
+                results[i] = self._run_local(fn, item, fallback)
+                if accept(results[i]):
+                    return i, results[i], results
+            return None, None, results
+
+        from concurrent.futures import as_completed
+        from concurrent.futures.process import BrokenProcessPool
+        futures = dict(zip(submitted, range(len(items))))
+        winner, broken, timed_out, delivered = None, None, False, 0
+        try:
+            for fut in as_completed(futures, timeout=self.timeout):
+                i = futures[fut]
+                try:
+                    results[i] = fut.result()
+                    delivered += 1
+                except BrokenProcessPool as e:
+                    broken = e
+                    results[i] = self._run_local(fn, items[i], fallback)
+                except Exception:
+                    delivered += 1
+                    results[i] = fallback(items[i])
+                if accept(results[i]):
+                    winner = i
+                    break
+        except TimeoutError:
+            timed_out = True
+        for fut in futures:
+            fut.cancel()
+        for i, item in enumerate(items):
+            if i not in results and winner is None:
+                results[i] = fallback(item)
+        self._after_break(broken, delivered, timed_out)
+        if winner is None:
+            return None, None, results
+        return winner, results[winner], results
+
+    def close(self):
+        self._reset_executor()
+        while not self._node_idle.empty():
+            self._node_idle.get().close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> FormatterPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = FormatterPool()
+        return _pool
@@ -1,6 +1,14 @@
 # generator/formatter.py
+import os
 import re
-import ast
+from operator import ne
+from itertools import compress
+
+from generator.metrics import timed
+
+# run a language plugin's validator only if its validation_cost is at most this
+# (0: string checks, 1: fast parse, 2: slow pure-Python parse such as pyjsparser)
+VALIDATION_BUDGET = int(os.getenv("CODEGEN_VALIDATION_BUDGET", "1") or 1)
 
 def format_python(code: str) -> str:
     try:
@@ -12,20 +20,10 @@ def format_python(code: str) -> str:
 
 
 def format_js(code: str) -> str:
+    # persistent prettier workers instead of one node process + temp file per call
     try:
-        import subprocess, tempfile, os
-        tf = tempfile.NamedTemporaryFile(delete=False, suffix=".js", mode="w", encoding="utf-8")
-        tf.write(code)
-        tf.flush()
-        tf.close()
-        subprocess.run(["prettier", "--write", tf.name], check=False)
-        with open(tf.name, "r", encoding="utf-8") as f:
-            out = f.read()
-        try:
-            os.unlink(tf.name)
-        except Exception:
-            pass
-        return out
+        from generator.format_pool import get_pool
+        return get_pool().format_js(code)
     except Exception:
         return code
 
@@ -39,35 +37,41 @@ def format_sql(code: str) -> str:
         return code
 
 
+def format_html(code: str) -> str:
+    # no formatter dependency for markup; just normalize whitespace
+    lines = [ln.rstrip() for ln in code.replace("\r\n", "\n").split("\n")]
+    return "\n".join(lines).strip() + "\n"
+
+
+# sanitize_code patterns, compiled once. The line searches start with a literal "\n"
+# so the regex engine can skip from one line break to the next (an alternation with
+# "^" would be tried at every offset); the start of the text is matched separately.
+_FENCED = re.compile(r"```(?:python)?\n(.*?)```", flags=re.S | re.I)
+_FIRST_CODE = re.compile(r"\n(?:def|class|from|import)\s", flags=re.I)
+_LEADING_CODE = re.compile(r"(?:def|class)\s", flags=re.I)
+# a code-like line; lines are "\n"-separated, so whitespace must not cross them
+_CODE_LINE = re.compile(r"[^\S\n]*(?:def |class |import |from |@|[a-zA-Z_]\w*[^\S\n]*=)")
+_NEXT_CODE_LINE = re.compile(r"\n" + _CODE_LINE.pattern)
+_SEPARATOR = re.compile(r"[-._]{2,}")
+
+
 def sanitize_code(raw: str) -> str:
-    import re
     # 1) If there's a fenced code block, extract it
-    m = re.search(r"```(?:python)?\n(.*?)```", raw, flags=re.S | re.I)
+    m = _FENCED.search(raw)
     if m:
         code = m.group(1)
     else:
         # find first sensible code start
-        idxs = []
-        for pattern in [r"\ndef\s", r"\nclass\s", r"\nfrom\s", r"\nimport\s", r"^def\s", r"^class\s"]:
-            mm = re.search(pattern, raw, flags=re.I)
-            if mm:
-                idxs.append(mm.start())
-        if idxs:
-            start = min(idxs)
-            code = raw[start:].lstrip()
+        if _LEADING_CODE.match(raw):
+            code = raw.lstrip()
         else:
-            code = raw
+            mm = _FIRST_CODE.search(raw)
+            code = raw[mm.start():].lstrip() if mm else raw
 
-    # collapse consecutive duplicate lines
+    # collapse consecutive duplicate lines: keep a line unless it strips to the same as the one before
     lines = code.splitlines()
-    cleaned_lines = []
-    prev = None
-    for ln in lines:
-        if ln.strip() == prev:
-            continue
-        cleaned_lines.append(ln)
-        prev = ln.strip()
-    code = "\n".join(cleaned_lines).strip()
+    stripped = list(map(str.strip, lines))
+    code = "\n".join(compress(lines, map(ne, stripped, [None] + stripped))).strip()
 
     # remove unterminated triple quotes
     if code.count('"""') % 2 == 1:
@@ -76,48 +80,161 @@ def sanitize_code(raw: str) -> str:
         code = code.replace("'''", '')
 
     # drop leading natural-language lines until a code-like line
-    code_lines = code.splitlines()
-    i = 0
-    while i < len(code_lines):
-        ln = code_lines[i].lstrip()
-        if ln.startswith(("def ", "class ", "import ", "from ", "@")) or re.match(r"[a-zA-Z_]\w*\s*=", ln):
+    if _CODE_LINE.match(code):
+        return code.strip()
+    m = _NEXT_CODE_LINE.search(code)
+    return code[m.start():].strip() if m else ""
+
+
+def _strip_separators(code: str) -> str:
+    """Drop separator lines ("---", "___") before the code."""
+    start = 0
+    while True:
+        end = code.find("\n", start)
+        if not _SEPARATOR.fullmatch(code[start:end if end != -1 else len(code)].strip()):
             break
-        i += 1
-    code = "\n".join(code_lines[i:]).strip()
-    return code
+        if end == -1:
+            return ""
+        start = end + 1
+    return code[start:].strip()
+
+
+class IncrementalSanitizer:
+    """Streaming counterpart of sanitize_code().
+
+    feed() takes raw text chunks and returns the code lines that became
+    available, applying the same fence/def/class extraction, duplicate-line
+    collapsing and leading-prose stripping on complete lines. The preview is
+    best effort (e.g. a fence that shows up after a bare def is not revisited);
+    finish() returns sanitize_code() over everything fed, which is authoritative.
+    """
+
+    _FENCE_OPEN = re.compile(r"```(?:python)?\n", flags=re.I)
+    _CODE_START = re.compile(r"(?:^|\n)(?:def|class|from|import)\s", flags=re.I)
+    _ASSIGN = re.compile(r"[a-zA-Z_]\w*\s*=")
 
+    def __init__(self):
+        self.raw = ""
+        self._start = None      # offset in raw where code begins
+        self._fenced = False
+        self._consumed = 0      # offset in raw up to which lines were emitted
+        self._done = False      # closing fence seen
+        self._prev = None
+        self._seen_code = False
 
-def postprocess_and_format(raw: str, lang: str = "python"):
-    code = sanitize_code(raw)
+    def feed(self, chunk: str) -> str:
+        self.raw += chunk
+        if self._done:
+            return ""
+        if self._start is None:
+            fence = self._FENCE_OPEN.search(self.raw)
+            if fence:
+                self._start, self._fenced = fence.end(), True
+            else:
+                code = self._CODE_START.search(self.raw)
+                if code:
+                    self._start = code.start() + (1 if self.raw[code.start()] == "\n" else 0)
+            if self._start is None:
+                return ""
+            self._consumed = self._start
+
+        end = self.raw.rfind("\n")
+        if end < self._consumed:
+            return ""
+        lines = self.raw[self._consumed:end].split("\n")
+        self._consumed = end + 1
+        out = []
+        for ln in lines:
+            if self._fenced and ln.strip().startswith("```"):
+                self._done = True
+                break
+            if ln.strip() == self._prev:
+                continue
+            self._prev = ln.strip()
+            if not self._seen_code:
+                stripped = ln.lstrip()
+                if stripped.startswith(("def ", "class ", "import ", "from ", "@")) or self._ASSIGN.match(stripped):
+                    self._seen_code = True
+                else:
+                    continue
+            out.append(ln + "\n")
+        return "".join(out)
+
+    def finish(self) -> str:
+        return sanitize_code(self.raw)
+
+
+def postprocess_and_format(raw: str, lang: str = "python", trace=None):
+    from generator.languages import canonical_name, get_language
+    lang = canonical_name(lang) or lang
+    with timed(trace, "sanitize"):
+        code = sanitize_code(raw)
     if not code:
         return raw, False, "Empty after sanitization"
 
     if lang == "python":
-        try:
-            ast.parse(code)
-            valid = True
-            msg = "Valid Python Syntax"
-        except SyntaxError as e:
-            # try light cleanup attempts
-            lines = code.splitlines()
-            while lines and re.match(r"^[-._]{2,}$", lines[0].strip()):
-                lines.pop(0)
-            code_try = "\n".join(lines).strip()
-            try:
-                ast.parse(code_try)
-                code = code_try
-                valid = True
-                msg = "Valid after light cleanup"
-            except SyntaxError:
-                valid = False
-                msg = f"invalid syntax: {e}"
+        from generator.validator import validate_python
+        with timed(trace, "parse"):
+            valid, msg = validate_python(code)
+        if not valid:
+            # try light cleanup: separator lines ("---", "___") before the code
+            code_try = _strip_separators(code)
+            # only re-parse when the cleanup changed something
+            if code_try != code:
+                with timed(trace, "parse"):
+                    if validate_python(code_try)[0]:
+                        code = code_try
+                        valid = True
+                        msg = "Valid after light cleanup"
         if valid:
             try:
-                formatted = format_python(code)
+                with timed(trace, "format"):
+                    formatted = format_python(code)
             except Exception:
                 formatted = code
         else:
             formatted = code
         return formatted, valid, msg
     else:
+        plugin = get_language(lang)
+        if plugin is not None and plugin.validation_cost <= VALIDATION_BUDGET:
+            with timed(trace, "parse"):
+                valid, msg = plugin.validate(code)
+            return code, valid, msg
         return code, True, "No validation implemented for this language"
+
+
+def postprocess_many(raws, lang: str = "python"):
+    """postprocess_and_format() for many outputs, spread over the formatter process pool."""
+    from generator.format_pool import get_pool
+    return get_pool().map(
+        postprocess_and_format,
+        [(raw, lang) for raw in raws],
+        fallback=lambda item: (item[0], False, "Postprocess error"),
+    )
+
+
+def _candidate_rank(processed):
+    formatted, valid, msg = processed
+    return (bool(formatted) and valid, msg != "Valid after light cleanup", len(formatted or ""))
+
+
+def postprocess_best(raws, lang: str = "python"):
+    """Post-process best-of-N candidates, stopping at the first usable one.
+
+    Candidates are sanitized/validated/formatted in parallel on the formatter
+    pool. Returns (index, processed, evaluated): the first candidate that comes
+    back valid and non-empty, otherwise the best-ranked one (valid, no cleanup
+    needed, longest), along with how many candidates were actually processed.
+    """
+    from generator.format_pool import get_pool
+    index, processed, results = get_pool().first(
+        postprocess_and_format,
+        [(raw, lang) for raw in raws],
+        accept=lambda r: bool(r[0]) and r[1],
+        fallback=lambda item: (item[0], False, "Postprocess error"),
+    )
+    if index is None:
+        index = max(results, key=lambda i: (_candidate_rank(results[i]), -i))
+        processed = results[index]
+    return index, processed, len(results)
@@ -0,0 +1,46 @@
+# generator/languages/__init__.py
+import importlib
+
+# canonical name -> "module:Class"; a plugin's module is only imported the first
+# time its language is asked for, so its formatter/validator deps load on demand
+_PLUGINS = {
+    "python": "generator.languages.python:PythonLanguage",
+    "javascript": "generator.languages.javascript:JavaScriptLanguage",
+    "sql": "generator.languages.sql:SQLLanguage",
+    "html_css": "generator.languages.html_css:HTML_CSS_Language",
+}
+
+# every accepted spelling -> canonical name
+_TABLE = {name: name for name in _PLUGINS}
+_TABLE.update({"py": "python", "python3": "python", "js": "javascript", "node": "javascript",
+               "html": "html_css", "css": "html_css"})
+
+_loaded = {}
+
+
+def register(name: str, target: str, aliases=()):
+    """Add a plugin given as "module:Class"; it is imported lazily like the built-in ones."""
+    _PLUGINS[name] = target
+    _loaded.pop(name, None)
+    for alias in (name,) + tuple(aliases):
+        _TABLE[alias.lower()] = name
+
+
+def get_language(lang: str):
+    """Plugin class for `lang` (any registered alias, case-insensitive), or None if unknown."""
+    name = _TABLE.get((lang or "").lower())
+    if name is None:
+        return None
+    plugin = _loaded.get(name)
+    if plugin is None:
+        module, cls = _PLUGINS[name].split(":")
+        plugin = _loaded[name] = getattr(importlib.import_module(module), cls)
+    return plugin
+
+
+def canonical_name(lang: str):
+    return _TABLE.get((lang or "").lower())
+
+
+def names():
+    return sorted(_PLUGINS)
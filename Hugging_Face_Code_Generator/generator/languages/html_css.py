@@ -1,12 +1,18 @@
 # generator/languages/html_css.py
+from generator.prompts import html_prompt
 from generator.formatter import format_html
 
 class HTML_CSS_Language:
     name = "html_css"
+    prompts = {"component": (html_prompt, ())}
+    default_mode = "component"
+    stop_sequences = ("\nDescription:", "\nGenerate a responsive")
+    validation_cost = 0
 
-    @staticmethod
-    def build_prompt(description, mode):
-        return f"""Generate a responsive HTML/CSS component.\nDescription: {description}\n"""
+    @classmethod
+    def build_prompt(cls, description, mode):
+        builder, args = cls.prompts[cls.default_mode]
+        return builder(description, *args)
 
     @staticmethod
     def format(code):
@@ -1,21 +1,27 @@
 # generator/languages/javascript.py
-from generator.prompts import function_prompt, class_prompt, api_prompt
+from generator.prompts import function_prompt, class_prompt, api_prompt, test_prompt
 from generator.formatter import format_js
 from generator.validator import validate_js
 
 class JavaScriptLanguage:
     name = "javascript"
+    prompts = {
+        "function": (function_prompt, ("javascript",)),
+        "class": (class_prompt, ("javascript",)),
+        "api": (api_prompt, ("javascript",)),
+        "test": (test_prompt, ("javascript",)),
+    }
+    default_mode = "function"
+    stop_sequences = ("\nDescription:", "\nYou are an expert")
+    # pyjsparser is pure Python and slow on long outputs
+    validation_cost = 2
 
-    @staticmethod
-    def build_prompt(description, mode):
-        if mode == "function":
-            return function_prompt(description, "javascript")
-        elif mode == "class":
-            return class_prompt(description, "javascript")
-        elif mode == "api":
-            return api_prompt(description, "javascript")
-        else:
+    @classmethod
+    def build_prompt(cls, description, mode):
+        if mode not in cls.prompts:
             raise ValueError("Unsupported mode for JavaScript")
+        builder, args = cls.prompts[mode]
+        return builder(description, *args)
 
     @staticmethod
     def format(code):
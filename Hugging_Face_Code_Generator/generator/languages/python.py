@@ -1,21 +1,29 @@
 # generator/languages/python.py
-from generator.prompts import function_prompt, class_prompt, api_prompt
+from generator.prompts import function_prompt, class_prompt, api_prompt, test_prompt
 from generator.formatter import format_python
 from generator.validator import validate_python
 
 class PythonLanguage:
     name = "python"
+    # mode -> (prompt builder, extra args)
+    prompts = {
+        "function": (function_prompt, ("python",)),
+        "class": (class_prompt, ("python",)),
+        "api": (api_prompt, ("python",)),
+        "test": (test_prompt, ("python",)),
+    }
+    default_mode = "function"
+    # generation stops where one of these appears (the model restating the prompt)
+    stop_sequences = ("\nDescription:", "\nYou are an expert")
+    # 0: string checks, 1: fast parse (ast), 2: slow pure-Python parse
+    validation_cost = 1
 
-    @staticmethod
-    def build_prompt(description, mode):
-        if mode == "function":
-            return function_prompt(description, "python")
-        elif mode == "class":
-            return class_prompt(description, "python")
-        elif mode == "api":
-            return api_prompt(description, "python")
-        else:
+    @classmethod
+    def build_prompt(cls, description, mode):
+        if mode not in cls.prompts:
             raise ValueError("Unsupported mode for Python")
+        builder, args = cls.prompts[mode]
+        return builder(description, *args)
 
     @staticmethod
     def format(code):
@@ -4,10 +4,16 @@ from generator.formatter import format_sql
 
 class SQLLanguage:
     name = "sql"
+    # one template whatever the mode
+    prompts = {"sql": (sql_prompt, ())}
+    default_mode = "sql"
+    stop_sequences = ("\nDescription:", "\nYou are an SQL expert")
+    validation_cost = 0
 
-    @staticmethod
-    def build_prompt(description, mode):
-        return sql_prompt(description)
+    @classmethod
+    def build_prompt(cls, description, mode):
+        builder, args = cls.prompts[cls.default_mode]
+        return builder(description, *args)
 
     @staticmethod
     def format(code):
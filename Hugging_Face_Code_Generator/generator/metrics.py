@@ -0,0 +1,165 @@
+# generator/metrics.py
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+# Histogram bucket upper bounds, in seconds.
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Trace:
+    """Timings and token counts for one generate() call.
+
+    Stages are timed with `with trace.stage("sanitize"):`; repeated stages add
+    up. "model" is the wall time of the model call; models that report it also
+    break that down into "tokenize", "prefill" and "decode". `path` says how the returned code was obtained: "model", "light_cleanup",
+    "fallback", "cache", "similar" (a near-duplicate description's result) or "coalesced" (joined an
+    identical call already in flight).
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.input_tokens = None
+        self.output_tokens = None
+        self.path = None
+        self.postprocess_error = False  # post-processing raised or timed out; the result is not cached
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def as_dict(self):
+        return {
+            "stages_ms": {k: round(v * 1000, 3) for k, v in self.stages.items()},
+            "total_ms": round((time.perf_counter() - self._start) * 1000, 3),
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "path": self.path,
+        }
+
+
+def timed(trace, name):
+    """trace.stage(name), or a no-op when there is no trace."""
+    return trace.stage(name) if trace is not None else nullcontext()
+
+
+_hooks = []
+_hooks_lock = threading.Lock()
+
+
+def add_hook(fn):
+    """Call fn(metrics_dict) after every generation; metrics_dict also carries lang and mode."""
+    with _hooks_lock:
+        _hooks.append(fn)
+    return fn
+
+
+def remove_hook(fn):
+    with _hooks_lock:
+        if fn in _hooks:
+            _hooks.remove(fn)
+
+
+def emit(metrics):
+    with _hooks_lock:
+        hooks = list(_hooks)
+    for fn in hooks:
+        try:
+            fn(metrics)
+        except Exception as e:
+            print(f"[metrics] hook {fn!r} failed: {e}")
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def to_dict(self):
+        return {"count": self.count, "sum": self.sum,
+                "buckets": {str(b): c for b, c in zip(BUCKETS, self.counts)}}
+
+
+class MetricsExporter:
+    """Aggregates emitted metrics into histograms for dashboards.
+
+        exporter = MetricsExporter()
+        add_hook(exporter.observe)
+        ...
+        print(exporter.to_prometheus())
+    """
+
+    def __init__(self, prefix: str = "codegen"):
+        self.prefix = prefix
+        self._stages = {}   # (stage, lang, mode) -> _Histogram
+        self._totals = {}   # (lang, mode) -> _Histogram
+        self._paths = {}    # (path, lang, mode) -> count
+        self._tokens = {"input": 0, "output": 0}
+        self._lock = threading.Lock()
+
+    def observe(self, metrics):
+        lang, mode = metrics.get("lang", ""), metrics.get("mode", "")
+        with self._lock:
+            for stage, ms in metrics.get("stages_ms", {}).items():
+                self._stages.setdefault((stage, lang, mode), _Histogram()).observe(ms / 1000)
+            self._totals.setdefault((lang, mode), _Histogram()).observe(metrics.get("total_ms", 0) / 1000)
+            key = (metrics.get("path") or "unknown", lang, mode)
+            self._paths[key] = self._paths.get(key, 0) + 1
+            self._tokens["input"] += metrics.get("input_tokens") or 0
+            self._tokens["output"] += metrics.get("output_tokens") or 0
+
+    def to_json(self):
+        with self._lock:
+            return json.dumps({
+                "stage_seconds": [dict(stage=s, lang=l, mode=m, **h.to_dict()) for (s, l, m), h in self._stages.items()],
+                "request_seconds": [dict(lang=l, mode=m, **h.to_dict()) for (l, m), h in self._totals.items()],
+                "paths": [dict(path=p, lang=l, mode=m, count=c) for (p, l, m), c in self._paths.items()],
+                "tokens": dict(self._tokens),
+            }, indent=2)
+
+    def _histogram_lines(self, name, labels, hist):
+        lines = []
+        for bound, count in zip(BUCKETS, hist.counts):
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist.count}')
+        lines.append(f"{name}_sum{{{labels}}} {hist.sum}")
+        lines.append(f"{name}_count{{{labels}}} {hist.count}")
+        return lines
+
+    def to_prometheus(self):
+        p = self.prefix
+        with self._lock:
+            lines = [f"# HELP {p}_stage_seconds Time spent per generate() stage.",
+                     f"# TYPE {p}_stage_seconds histogram"]
+            for (stage, lang, mode), hist in sorted(self._stages.items()):
+                lines += self._histogram_lines(f"{p}_stage_seconds", f'stage="{stage}",lang="{lang}",mode="{mode}"', hist)
+            lines += [f"# HELP {p}_request_seconds End-to-end generate() latency.",
+                      f"# TYPE {p}_request_seconds histogram"]
+            for (lang, mode), hist in sorted(self._totals.items()):
+                lines += self._histogram_lines(f"{p}_request_seconds", f'lang="{lang}",mode="{mode}"', hist)
+            lines += [f"# HELP {p}_requests_total Generations by result path.",
+                      f"# TYPE {p}_requests_total counter"]
+            for (path, lang, mode), count in sorted(self._paths.items()):
+                lines.append(f'{p}_requests_total{{path="{path}",lang="{lang}",mode="{mode}"}} {count}')
+            lines += [f"# HELP {p}_tokens_total Prompt and generated tokens.",
+                      f"# TYPE {p}_tokens_total counter"]
+            for kind, count in self._tokens.items():
+                lines.append(f'{p}_tokens_total{{kind="{kind}"}} {count}')
+        return "\n".join(lines) + "\n"
@@ -1,33 +1,84 @@
 # generator/models.py
 import os
+import time
+import threading
 
 DEFAULT_MODEL = os.getenv("CODEGEN_MODEL", "Salesforce/codegen-350M-multi")
+# fp32 | bf16 | fp16 | int8 (dynamic quantization of Linear layers); unset keeps the checkpoint default
+DEFAULT_PRECISION = os.getenv("CODEGEN_PRECISION") or None
+# assisted decoding: a small draft model sharing the tokenizer, or n-gram lookup in the prompt (tokens per guess)
+DEFAULT_DRAFT_MODEL = os.getenv("CODEGEN_DRAFT_MODEL") or None
+DEFAULT_PROMPT_LOOKUP = int(os.getenv("CODEGEN_PROMPT_LOOKUP", "0") or 0)
+
+_PRECISIONS = {
+    "fp32": "float32", "float32": "float32",
+    "bf16": "bfloat16", "bfloat16": "bfloat16",
+    "fp16": "float16", "float16": "float16",
+    "int8": "int8", "qint8": "int8",
+}
+
+
+def normalize_precision(dtype):
+    """Map a precision name (fp32/bf16/fp16/int8 or torch dtype name) to its canonical form."""
+    if dtype is None:
+        return None
+    try:
+        return _PRECISIONS[str(dtype).lower()]
+    except KeyError:
+        raise ValueError(f"Unsupported precision {dtype!r}; use one of fp32, bf16, fp16, int8") from None
 
 class CodeGenModel:
-    def __init__(self, model_name: str = DEFAULT_MODEL, device: str = None):
-        self.model_name = model_name
-        self.device = device or ("cuda" if self._cuda_available() else "cpu")
-        self.tokenizer = None
-        self.model = None
+    # generate() returns the prompt followed by the completion; generate_stream() yields only the completion
+    echoes_prompt = True
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, device: str = None, dtype: str = DEFAULT_PRECISION):
+        self._init_state(model_name, device, normalize_precision(dtype))
+        dtype = self.dtype
 
         try:
-            from transformers import AutoTokenizer, AutoModelForCausalLM
-            import torch  # noqa: F401
+            import transformers
+            import torch
         except Exception as e:
             raise ImportError(
                 "transformers/torch not available. Install with: 'pip install transformers torch sentencepiece huggingface_hub'\n"
                 f"Original error: {e}"
             ) from e
 
+        # a snapshot from `cli.py prepare` has a fast tokenizer.json and weights already in this dtype
+        from generator.snapshot import find_snapshot, load_snapshot
+        snapshot = find_snapshot(model_name, dtype)
+
         try:
             print(f"[models] Loading tokenizer for model: {model_name} ... (device={self.device})")
-            self.tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=False)
-            print("[models] Tokenizer loaded. Loading model (this may take some time)...")
-            if self.device == "cuda":
-                self.model = AutoModelForCausalLM.from_pretrained(model_name, device_map="auto")
+            if snapshot and self.device != "cuda":
+                print(f"[models] Using prepared snapshot: {snapshot}")
+                self.tokenizer, self.model = load_snapshot(snapshot)
+                if dtype and dtype != "int8" and self.model.dtype != getattr(torch, dtype):
+                    self.model = self.model.to(getattr(torch, dtype))
             else:
-                self.model = AutoModelForCausalLM.from_pretrained(model_name)
-            print("[models] Model loaded successfully.")
+                from transformers import AutoTokenizer, AutoModelForCausalLM
+                source = snapshot or model_name
+                self.tokenizer = AutoTokenizer.from_pretrained(source, use_fast=bool(snapshot))
+                print("[models] Tokenizer loaded. Loading model (this may take some time)...")
+                # low_cpu_mem_usage loads weights straight into the target dtype, so peak RSS
+                # stays near the final model size instead of a random init plus a full copy
+                load_kwargs = {"low_cpu_mem_usage": True}
+                if dtype == "int8":
+                    load_kwargs["torch_dtype"] = torch.float32
+                elif dtype:
+                    load_kwargs["torch_dtype"] = getattr(torch, dtype)
+                if self.device == "cuda":
+                    self.model = AutoModelForCausalLM.from_pretrained(source, device_map="auto", **load_kwargs)
+                else:
+                    self.model = AutoModelForCausalLM.from_pretrained(source, **load_kwargs)
+            if dtype == "int8":
+                if self.device != "cpu":
+                    raise ValueError("int8 dynamic quantization is only supported on CPU")
+                self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+            self.model.eval()
+            print(f"[models] Model loaded successfully (precision={dtype or 'default'}).")
+            if DEFAULT_DRAFT_MODEL:
+                self.set_assistant(draft=DEFAULT_DRAFT_MODEL)
         except Exception as e:
             msg = (
                 "[models] Failed to load model from Hugging Face. "
@@ -38,6 +89,92 @@ class CodeGenModel:
             )
             raise OSError(msg) from e
 
+    def _init_state(self, model_name, device, dtype):
+        self.model_name = model_name
+        self.device = device or ("cuda" if self._cuda_available() else "cpu")
+        self.dtype = dtype
+        self.tokenizer = None
+        self.model = None
+        # cumulative early-stopping counters; per-call numbers via last_generation_stats()
+        self.stop_stats = {"requests": 0, "tokens_generated": 0, "tokens_saved": 0}
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+        self.prefix_cache = None
+        self.assistant_model = None
+        self.prompt_lookup_tokens = DEFAULT_PROMPT_LOOKUP
+        # cumulative assisted-decoding counters: draft tokens proposed/accepted, target forward passes
+        self.assist_stats = {"requests": 0, "proposed": 0, "accepted": 0, "forwards": 0}
+
+    @classmethod
+    def from_loaded(cls, model, tokenizer, model_name: str, device: str = "cpu", dtype: str = None):
+        """Wrap an already loaded model/tokenizer pair (e.g. weights shared from another process)."""
+        obj = cls.__new__(cls)
+        obj._init_state(model_name, device, dtype)
+        obj.model = model
+        obj.tokenizer = tokenizer
+        return obj
+
+    def set_assistant(self, draft=None, prompt_lookup_tokens: int = None):
+        """Turn on assisted decoding for generate().
+
+        `draft` is a small causal LM (name, path or loaded model) using the same
+        tokenizer; it proposes tokens that the main model verifies in one forward
+        pass. Without a draft, `prompt_lookup_tokens` > 0 proposes continuations by
+        matching the last n-gram against the prompt instead, which pays off when
+        the code copies names and signatures from the description. Greedy outputs
+        are unchanged either way; pass draft=None, prompt_lookup_tokens=0 to turn it off.
+        """
+        if isinstance(draft, str):
+            import torch
+            from transformers import AutoModelForCausalLM
+            print(f"[models] Loading draft model: {draft}")
+            # int8 targets still get a float draft; quantizing a tiny model gains little
+            torch_dtype = getattr(torch, self.dtype) if self.dtype and self.dtype != "int8" else None
+            draft = AutoModelForCausalLM.from_pretrained(draft, low_cpu_mem_usage=True, torch_dtype=torch_dtype)
+            draft.to(self.model.device).eval()
+        self.assistant_model = draft
+        if prompt_lookup_tokens is not None:
+            self.prompt_lookup_tokens = prompt_lookup_tokens
+        return self
+
+    def _assist_kwargs(self):
+        if self.assistant_model is not None:
+            return {"assistant_model": self.assistant_model}
+        if self.prompt_lookup_tokens > 0:
+            return {"prompt_lookup_num_tokens": self.prompt_lookup_tokens}
+        return {}
+
+    def _count_verification(self, prompt_len):
+        """Hook the main model's forward to count how many draft tokens each pass verifies.
+
+        Every verification pass feeds the last accepted token plus the guesses (the
+        first pass feeds the prompt plus the guesses) and yields exactly one token of
+        its own, so accepted guesses = new tokens - passes. Returns (counts, handle).
+        """
+        counts = {"forwards": 0, "proposed": 0}
+
+        def hook(module, args, kwargs):
+            ids = kwargs.get("input_ids")
+            if ids is None and args:
+                ids = args[0]
+            if ids is None:
+                return
+            fed = ids.shape[-1]
+            counts["proposed"] += fed - (prompt_len if counts["forwards"] == 0 else 1)
+            counts["forwards"] += 1
+
+        return counts, self.model.register_forward_pre_hook(hook, with_kwargs=True)
+
+    def _assist_report(self, counts, new_tokens, mode):
+        accepted = max(0, min(counts["proposed"], new_tokens - counts["forwards"]))
+        with self._stats_lock:
+            self.assist_stats["requests"] += 1
+            self.assist_stats["proposed"] += counts["proposed"]
+            self.assist_stats["accepted"] += accepted
+            self.assist_stats["forwards"] += counts["forwards"]
+        return {"mode": mode, "proposed": counts["proposed"], "accepted": accepted, "forwards": counts["forwards"],
+                "acceptance_rate": round(accepted / counts["proposed"], 4) if counts["proposed"] else 0.0}
+
     def _cuda_available(self):
         try:
             import torch
@@ -45,18 +182,266 @@ class CodeGenModel:
         except Exception:
             return False
 
-    def generate(self, prompt: str, max_new_tokens: int = 256, temperature: float = 0.2, top_p: float = 0.95):
+    def _stopping_kwargs(self, prompt_len, lang, mode, cancel=None):
+        """Extra generate() kwargs: a first-token timer, language-aware early stopping
+        when lang is known, and a cancel() check before every token when given.
+        Returns (kwargs, code_criteria_or_None, timer)."""
+        from transformers import StoppingCriteriaList
+        from generator.stopping import make_stopping_criteria, make_first_token_timer, make_cancel_criteria
+        timer = make_first_token_timer()
+        criteria = make_stopping_criteria(self.tokenizer, prompt_len, lang, mode) if lang is not None else None
+        items = [timer] + ([criteria] if criteria is not None else [])
+        if cancel is not None:
+            items.append(make_cancel_criteria(cancel))
+        return {"stopping_criteria": StoppingCriteriaList(items)}, criteria, timer
+
+    @staticmethod
+    def _timings(start, tokenized, timer, finished, prompt_len):
+        # prefill ends when the first new token exists (the first stopping-criteria call)
+        first = timer.first_token_at or finished
+        return {"prompt_tokens": int(prompt_len), "tokenize_s": tokenized - start,
+                "prefill_s": first - tokenized, "decode_s": finished - first}
+
+    def _decode_row(self, row, prompt_len, stop, max_new_tokens):
+        """Decode one output row, cutting the completion where the stopping rule matched."""
+        text = self.tokenizer.decode(row, skip_special_tokens=True)
+        new_ids = row[prompt_len:]
+        new_tokens = int((new_ids != self.tokenizer.pad_token_id).sum()) if self.tokenizer.pad_token_id is not None \
+            else int(new_ids.shape[0])
+        reason = None
+        if stop is not None:
+            offset, reason, new_tokens = stop
+            completion = self.tokenizer.decode(new_ids, skip_special_tokens=True)
+            if text.endswith(completion):
+                text = text[:len(text) - len(completion)] + completion[:offset]
+        return text, {"new_tokens": new_tokens, "tokens_saved": max(0, max_new_tokens - new_tokens),
+                      "stop_reason": reason or "max_new_tokens_or_eos"}
+
+    def _record(self, stats):
+        self._local.last_stats = stats
+        with self._stats_lock:
+            for st in stats:
+                self.stop_stats["requests"] += 1
+                self.stop_stats["tokens_generated"] += st["new_tokens"]
+                self.stop_stats["tokens_saved"] += st["tokens_saved"]
+
+    def last_generation_stats(self):
+        """Per-row stats of this thread's last call: new_tokens, tokens_saved, stop_reason,
+        prompt_tokens and tokenize_s/prefill_s/decode_s timings."""
+        return list(getattr(self._local, "last_stats", []))
+
+    def _with_prefix(self, inputs, prompt, prefix):
+        if not prefix:
+            return inputs
+        if self.prefix_cache is None:
+            from generator.prefix_cache import PrefixCache
+            self.prefix_cache = PrefixCache(self.model, self.tokenizer)
+        try:
+            return self.prefix_cache.prepare(inputs, prompt, prefix)
+        except Exception as e:
+            print(f"[models] Prefix cache unavailable, using full prefill: {e}")
+            return inputs
+
+    def generate(self, prompt: str, max_new_tokens: int = 256, temperature: float = 0.2, top_p: float = 0.95,
+                 lang: str = None, mode: str = "function", prefix: str = None, cancel=None):
+        """Generate a completion for one prompt and return prompt + completion text.
+
+        When `lang` is given, generation stops as soon as the code unit is complete
+        (see generator/stopping.py) instead of always running to max_new_tokens.
+        `prefix` is the constant template header of `prompt`; its KV-cache is
+        computed once and reused so only the rest of the prompt is prefilled.
+        `cancel` is a callable checked before every new token; once it returns
+        True decoding stops and the partial text is returned.
+        """
         if self.model is None or self.tokenizer is None:
             raise RuntimeError("Model not loaded")
 
+        start = time.perf_counter()
         inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
+        tokenized = time.perf_counter()
+        prompt_len = inputs["input_ids"].shape[1]
+        stop_kwargs, criteria, timer = self._stopping_kwargs(prompt_len, lang, mode, cancel)
+        assist = self._assist_kwargs()
+        if assist:
+            # the draft/lookup candidates are verified against a fresh cache, so no prefix reuse
+            counts, handle = self._count_verification(prompt_len)
+        else:
+            inputs = self._with_prefix(inputs, prompt, prefix)
+        import torch as _torch
+        try:
+            with _torch.no_grad():
+                outputs = self.model.generate(
+                    **inputs,
+                    max_new_tokens=max_new_tokens,
+                    temperature=temperature,
+                    top_p=top_p,
+                    pad_token_id=self.tokenizer.eos_token_id,
+                    **stop_kwargs,
+                    **assist,
+                )
+        finally:
+            if assist:
+                handle.remove()
+        stop = criteria.stops.get(0) if criteria is not None else None
+        text, stats = self._decode_row(outputs[0], prompt_len, stop, max_new_tokens)
+        stats.update(self._timings(start, tokenized, timer, time.perf_counter(), prompt_len))
+        if assist:
+            # count against what was actually decoded, not the stop-trimmed completion
+            decoded = int(outputs.shape[1] - prompt_len)
+            stats["assisted"] = self._assist_report(counts, decoded,
+                                                    "draft" if "assistant_model" in assist else "prompt_lookup")
+        self._record([stats])
+        return text
+
+    def generate_candidates(self, prompt: str, n: int = 4, max_new_tokens: int = 256, temperature: float = 0.8,
+                            top_p: float = 0.95, lang: str = None, mode: str = "function", cancel=None):
+        """Sample `n` completions of one prompt in a single generate() call.
+
+        The prompt is prefilled once and its KV-cache repeated for every
+        candidate row; if the cache type cannot be repeated this falls back to
+        num_return_sequences, which prefills each row. Returns prompt + completion
+        texts, one per candidate. `cancel` works as in generate() for all rows.
+        """
+        if self.model is None or self.tokenizer is None:
+            raise RuntimeError("Model not loaded")
+
         import torch as _torch
+        start = time.perf_counter()
+        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
+        tokenized = time.perf_counter()
+        prompt_len = inputs["input_ids"].shape[1]
+        stop_kwargs, criteria, timer = self._stopping_kwargs(prompt_len, lang, mode, cancel)
+        sample_kwargs = dict(max_new_tokens=max_new_tokens, do_sample=True, temperature=temperature, top_p=top_p,
+                             pad_token_id=self.tokenizer.eos_token_id, **stop_kwargs)
+
         with _torch.no_grad():
-            outputs = self.model.generate(
-                **inputs,
-                max_new_tokens=max_new_tokens,
-                temperature=temperature,
-                top_p=top_p,
-                pad_token_id=self.tokenizer.eos_token_id,
-            )
-        return self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+            try:
+                from transformers import DynamicCache
+                ids, mask = inputs["input_ids"], inputs["attention_mask"]
+                # everything but the last prompt token goes into the shared cache; generate() feeds that token
+                past = self.model(input_ids=ids[:, :-1], past_key_values=DynamicCache(), use_cache=True).past_key_values
+                past.batch_repeat_interleave(n)
+                outputs = self.model.generate(input_ids=ids.repeat(n, 1), attention_mask=mask.repeat(n, 1),
+                                              past_key_values=past, **sample_kwargs)
+            except (ImportError, AttributeError, TypeError, ValueError):
+                stop_kwargs, criteria, timer = self._stopping_kwargs(prompt_len, lang, mode, cancel)
+                sample_kwargs.update(stop_kwargs)
+                outputs = self.model.generate(**inputs, num_return_sequences=n, **sample_kwargs)
+
+        finished = time.perf_counter()
+        texts, all_stats = [], []
+        for i, row in enumerate(outputs):
+            stop = criteria.stops.get(i) if criteria is not None else None
+            text, stats = self._decode_row(row, prompt_len, stop, max_new_tokens)
+            stats.update(self._timings(start, tokenized, timer, finished, prompt_len))
+            texts.append(text)
+            all_stats.append(stats)
+        self._record(all_stats)
+        return texts
+
+    def generate_stream(self, prompt: str, max_new_tokens: int = 256, temperature: float = 0.2, top_p: float = 0.95,
+                        lang: str = None, mode: str = "function", prefix: str = None):
+        """Yield decoded text chunks of the completion as tokens are produced.
+
+        The prompt itself is not yielded; callers that need the same text as
+        generate() prepend it.
+        """
+        if self.model is None or self.tokenizer is None:
+            raise RuntimeError("Model not loaded")
+
+        import torch as _torch
+        from transformers import TextIteratorStreamer
+
+        start = time.perf_counter()
+        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
+        tokenized = time.perf_counter()
+        prompt_len = inputs["input_ids"].shape[1]
+        stop_kwargs, criteria, timer = self._stopping_kwargs(prompt_len, lang, mode)
+        inputs = self._with_prefix(inputs, prompt, prefix)
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        errors = []
+        outputs = []
+
+        def _run():
+            try:
+                with _torch.no_grad():
+                    outputs.append(self.model.generate(
+                        **inputs,
+                        max_new_tokens=max_new_tokens,
+                        temperature=temperature,
+                        top_p=top_p,
+                        pad_token_id=self.tokenizer.eos_token_id,
+                        streamer=streamer,
+                        **stop_kwargs,
+                    ))
+            except Exception as e:
+                errors.append(e)
+                streamer.end()
+
+        worker = threading.Thread(target=_run, daemon=True)
+        worker.start()
+        for text in streamer:
+            if text:
+                yield text
+        worker.join()
+        if errors:
+            raise errors[0]
+        # stats are recorded on the consuming thread, like generate()
+        stop = criteria.stops.get(0) if criteria is not None else None
+        _, stats = self._decode_row(outputs[0][0], prompt_len, stop, max_new_tokens)
+        stats.update(self._timings(start, tokenized, timer, time.perf_counter(), prompt_len))
+        self._record([stats])
+
+    def generate_batch(self, prompts, max_new_tokens: int = 256, temperature: float = 0.2, top_p: float = 0.95,
+                       batch_size: int = 8, lang: str = None, mode: str = "function", cancel=None):
+        """Generate completions for many prompts, one model.generate call per micro-batch.
+
+        Prompts are left-padded so every row ends at the same position and new tokens
+        are appended directly after each prompt. Results keep the input order.
+        `cancel` works as in generate(); remaining micro-batches are skipped once it fires.
+        """
+        if self.model is None or self.tokenizer is None:
+            raise RuntimeError("Model not loaded")
+
+        prompts = list(prompts)
+        if not prompts:
+            return []
+        batch_size = max(1, int(batch_size))
+
+        # decoder-only models must be padded on the left for batched generation
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+
+        import torch as _torch
+        results = []
+        all_stats = []
+        for start in range(0, len(prompts), batch_size):
+            if cancel is not None and cancel():
+                break
+            chunk = prompts[start:start + batch_size]
+            began = time.perf_counter()
+            inputs = self.tokenizer(chunk, return_tensors="pt", padding=True).to(self.model.device)
+            tokenized = time.perf_counter()
+            prompt_len = inputs["input_ids"].shape[1]
+            stop_kwargs, criteria, timer = self._stopping_kwargs(prompt_len, lang, mode, cancel)
+            with _torch.no_grad():
+                outputs = self.model.generate(
+                    **inputs,
+                    max_new_tokens=max_new_tokens,
+                    temperature=temperature,
+                    top_p=top_p,
+                    pad_token_id=self.tokenizer.pad_token_id,
+                    **stop_kwargs,
+                )
+            # timings are per micro-batch, shared by its rows
+            timings = self._timings(began, tokenized, timer, time.perf_counter(), prompt_len)
+            for i, row in enumerate(outputs):
+                stop = criteria.stops.get(i) if criteria is not None else None
+                text, stats = self._decode_row(row, prompt_len, stop, max_new_tokens)
+                stats.update(timings)
+                stats["prompt_tokens"] = int(inputs["attention_mask"][i].sum())
+                results.append(text)
+                all_stats.append(stats)
+        self._record(all_stats)
+        return results
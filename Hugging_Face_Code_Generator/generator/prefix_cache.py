@@ -0,0 +1,95 @@
+# generator/prefix_cache.py
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class PrefixCache:
+    """Precomputed KV-cache for the constant instruction header of each prompt template.
+
+    Entries are keyed by a hash of the prefix text, so editing a template in
+    generator/prompts.py simply produces a new entry. The cache lives on one
+    CodeGenModel instance, so a different model never sees another model's state.
+    """
+
+    def __init__(self, model, tokenizer, max_entries: int = 32):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # sha -> (prefix_ids, past_key_values)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "bypassed": 0}
+
+    def _compute(self, prefix):
+        import torch
+        ids = self.tokenizer(prefix, return_tensors="pt")["input_ids"].to(self.model.device)
+        kwargs = {}
+        try:
+            from transformers import DynamicCache
+            kwargs["past_key_values"] = DynamicCache()
+        except ImportError:
+            pass
+        with torch.no_grad():
+            out = self.model(input_ids=ids, use_cache=True, **kwargs)
+        return ids, out.past_key_values
+
+    def get(self, prefix):
+        """(prefix_ids, past_key_values) for `prefix`, computed on first use."""
+        return self._get(prefix)[0]
+
+    def _get(self, prefix):
+        key = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key], False
+        entry = self._compute(prefix)
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry, True
+
+    def prepare(self, inputs, prompt, prefix):
+        """Add a copy of the cached prefix state to tokenized `inputs`.
+
+        Trailing whitespace is cut from the prefix first: BPE tokenizers merge
+        the space of "Description: " into the next word, so only the stripped
+        header tokenizes the same on its own and inside the prompt. If the
+        tokens still differ at the end (another merge across the boundary),
+        the state is cropped to the tokens both share. Falls back to plain
+        inputs when nothing is shared, so outputs never change.
+        """
+        prefix = (prefix or "").rstrip()
+        if not prefix or not prompt.startswith(prefix):
+            self.stats["bypassed"] += 1
+            return inputs
+        # compare tokens before paying for a prefix forward pass
+        ids = self.tokenizer(prefix)["input_ids"]
+        input_ids = inputs["input_ids"]
+        row = input_ids[0, :len(ids)].tolist()
+        shared = 0
+        while shared < len(row) and row[shared] == ids[shared]:
+            shared += 1
+        if shared == 0 or shared >= input_ids.shape[1]:
+            self.stats["bypassed"] += 1
+            return inputs
+        (_, past), computed = self._get(prefix)
+        # generate() extends the cache in place, so every call gets its own copy
+        past = copy.deepcopy(past)
+        if shared < len(ids):
+            if not hasattr(past, "crop"):
+                self.stats["bypassed"] += 1
+                return inputs
+            past.crop(shared)
+        # counted only once the state is actually used
+        with self._lock:
+            self.stats["misses" if computed else "hits"] += 1
+        prepared = dict(inputs)
+        prepared["past_key_values"] = past
+        return prepared
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
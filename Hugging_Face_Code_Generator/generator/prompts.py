@@ -59,3 +59,19 @@ def sql_prompt(description: str) -> str:
         f"Description: {description}\n"
         "Prefer readable formatting and avoid vendor-specific functions unless requested."
     )
+
+
+def html_prompt(description: str) -> str:
+    return f"""Generate a responsive HTML/CSS component.\nDescription: {description}\n"""
+
+
+_PREFIX_SENTINEL = "\x00DESCRIPTION\x00"
+
+
+def prompt_prefix(builder, *args) -> str:
+    """Constant text a prompt builder emits before the description.
+
+    Derived from the template itself, so it follows any edit to the wording.
+    """
+    text = builder(_PREFIX_SENTINEL, *args)
+    return text.split(_PREFIX_SENTINEL, 1)[0]
@@ -0,0 +1,124 @@
+# generator/registry.py
+import os
+import gc
+import threading
+from collections import OrderedDict
+
+# Optional memory budget (MB) across all loaded models; 0/unset means unlimited.
+MEMORY_BUDGET_MB = float(os.getenv("CODEGEN_MODEL_MEMORY_BUDGET_MB", "0") or 0)
+
+
+def _model_nbytes(model):
+    """Best-effort size of a loaded model's weights in bytes (0 if unknown)."""
+    inner = getattr(model, "model", None)
+    if inner is None or not hasattr(inner, "parameters"):
+        return 0
+    try:
+        total = sum(p.numel() * p.element_size() for p in inner.parameters())
+        total += sum(b.numel() * b.element_size() for b in inner.buffers())
+        return total
+    except Exception:
+        return 0
+
+
+class ModelRegistry:
+    """Process-wide cache of loaded models keyed by (model_name, device, dtype).
+
+    Every caller asking for the same key gets the same instance, so weights are
+    loaded once per process. Models are kept in least-recently-used order and,
+    when a memory budget is set, the oldest ones are dropped to make room.
+    """
+
+    def __init__(self, loader=None, memory_budget_mb: float = MEMORY_BUDGET_MB):
+        self._loader = loader
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024) if memory_budget_mb else 0
+        self._models = OrderedDict()  # key -> (model, nbytes)
+        self._lock = threading.RLock()
+        self._key_locks = {}
+
+    def _load(self, model_name, device, dtype):
+        if self._loader is not None:
+            return self._loader(model_name, device=device, dtype=dtype)
+        from generator.models import CodeGenModel
+        return CodeGenModel(model_name, device=device, dtype=dtype)
+
+    def get(self, model_name: str, device: str = None, dtype: str = None):
+        from generator.models import normalize_precision
+        dtype = normalize_precision(dtype)
+        key = (model_name, device, dtype)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key][0]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # load outside the registry lock so other keys stay available; the
+        # per-key lock makes concurrent callers for the same key wait for one load
+        with key_lock:
+            with self._lock:
+                if key in self._models:
+                    self._models.move_to_end(key)
+                    return self._models[key][0]
+            model = self._load(model_name, device, dtype)
+            with self._lock:
+                self._models[key] = (model, _model_nbytes(model))
+                self._evict(keep=key)
+                self._key_locks.pop(key, None)
+            return model
+
+    def _evict(self, keep=None):
+        if not self.memory_budget:
+            return
+        while self.total_bytes() > self.memory_budget and len(self._models) > 1:
+            oldest = next(iter(self._models))
+            if oldest == keep:
+                break
+            print(f"[registry] Memory budget exceeded, unloading {oldest[0]}")
+            self._drop(oldest)
+
+    def _drop(self, key):
+        model, _ = self._models.pop(key)
+        del model
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except Exception:
+            pass
+
+    def unload(self, model_name: str = None, device: str = None, dtype: str = None):
+        """Forget a loaded model (or every model when model_name is None).
+
+        Returns the number of entries removed. Generators that still hold a
+        reference keep working; the weights are freed once they are gone too.
+        """
+        from generator.models import normalize_precision
+        dtype = normalize_precision(dtype)  # same key get() stored, so "bf16" finds a "bfloat16" load
+        with self._lock:
+            if model_name is None:
+                keys = list(self._models)
+            else:
+                keys = [k for k in self._models if k == (model_name, device, dtype)]
+            for key in keys:
+                self._drop(key)
+            return len(keys)
+
+    def total_bytes(self):
+        with self._lock:
+            return sum(nbytes for _, nbytes in self._models.values())
+
+    def loaded(self):
+        with self._lock:
+            return list(self._models)
+
+
+_default_registry = ModelRegistry()
+
+
+def get_model(model_name: str, device: str = None, dtype: str = None):
+    return _default_registry.get(model_name, device=device, dtype=dtype)
+
+
+def unload_model(model_name: str = None, device: str = None, dtype: str = None):
+    return _default_registry.unload(model_name, device=device, dtype=dtype)
@@ -0,0 +1,234 @@
+# generator/replicas.py
+import os
+import queue
+import itertools
+import threading
+from concurrent.futures import Future, wait
+
+
+def _replica_main(index, factory, factory_kwargs, shared, threads, cpus, jobs, results, control, current):
+    """Body of one replica process: build a generator, then serve jobs until a None arrives.
+
+    Ids of cancelled jobs arrive on `control`; a cancelled job that has not
+    started is skipped, a running one sees its `cancel` callable turn true.
+    `current` (shared memory) holds the id of the job taken last, so the
+    parent knows which job to fail if this process dies."""
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except Exception:
+        pass
+    if cpus and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, cpus)
+        except OSError:
+            pass
+
+    try:
+        generator = factory(**factory_kwargs)
+        if shared is not None:
+            from generator.models import CodeGenModel
+            generator.model = CodeGenModel.from_loaded(**shared)
+        results.put(("ready", index, None))
+    except Exception as e:
+        results.put(("failed", index, repr(e)))
+        return
+
+    cancelled = set()
+
+    def watch():
+        while True:
+            job_id = control.get()
+            if job_id is None:
+                break
+            cancelled.add(job_id)
+
+    threading.Thread(target=watch, daemon=True).start()
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        job_id, method, args, kwargs, cancellable = job
+        current.value = job_id
+        if job_id in cancelled:
+            cancelled.discard(job_id)
+            continue
+        if cancellable:
+            kwargs = dict(kwargs, cancel=lambda job_id=job_id: job_id in cancelled)
+        try:
+            results.put((job_id, True, getattr(generator, method)(*args, **kwargs)))
+        except Exception as e:
+            results.put((job_id, False, repr(e)))
+        cancelled.discard(job_id)
+
+
+class ReplicaPool:
+    """N generator replicas in separate processes, fed from one shared job queue.
+
+    Each replica gets threads_per_replica torch threads and, where the OS
+    supports it, is pinned to its own slice of CPUs. When `shared` (a dict of
+    CodeGenModel.from_loaded kwargs) is given, its tensors are moved to shared
+    memory once and every replica maps the same read-only weights instead of
+    loading a private copy. Results are returned per job, so callers get them
+    back in submission order regardless of which replica finished first.
+    Jobs run through run()/map() with a `cancel` callable are stopped at
+    the replica's next token once it returns True. A replica that dies fails
+    the job it was running with RuntimeError; once none are left, every
+    pending and later job fails the same way.
+    """
+
+    def __init__(self, factory, replicas: int, threads_per_replica: int = None, factory_kwargs: dict = None,
+                 shared: dict = None, pin: bool = True):
+        import torch.multiprocessing as mp
+        ctx = mp.get_context("spawn")  # fork is unsafe once torch has started its thread pools
+
+        cpus = os.cpu_count() or 1
+        self.replicas = max(1, replicas)
+        self.threads_per_replica = threads_per_replica or max(1, cpus // self.replicas)
+        if shared is not None:
+            shared["model"].share_memory()
+
+        self._jobs = ctx.Queue()
+        self._results = ctx.Queue()
+        self._controls = [ctx.Queue() for _ in range(self.replicas)]
+        self._current = [ctx.Value("q", -1, lock=False) for _ in range(self.replicas)]
+        self._dead = set()
+        self._closing = False
+        self._futures = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._procs = []
+        for i in range(self.replicas):
+            first = (i * self.threads_per_replica) % cpus
+            pinned = {(first + k) % cpus for k in range(self.threads_per_replica)} if pin else None
+            proc = ctx.Process(
+                target=_replica_main,
+                args=(i, factory, factory_kwargs or {}, shared, self.threads_per_replica, pinned,
+                      self._jobs, self._results, self._controls[i], self._current[i]),
+                daemon=True,
+            )
+            proc.start()
+            self._procs.append(proc)
+
+        ready = 0
+        while ready < self.replicas:
+            try:
+                kind, index, err = self._results.get(timeout=1.0)
+            except queue.Empty:
+                dead = [(i, proc.exitcode) for i, proc in enumerate(self._procs) if not proc.is_alive()]
+                if dead:
+                    self.close()
+                    raise RuntimeError(f"replica {dead[0][0]} exited while starting (exit code {dead[0][1]})") from None
+                continue
+            if kind == "failed":
+                self.close()
+                raise RuntimeError(f"replica {index} failed to start: {err}")
+            ready += 1
+
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def _collect(self):
+        while True:
+            try:
+                item = self._results.get(timeout=1.0)
+            except queue.Empty:
+                item = ()
+            self._reap()
+            if item is None:
+                break
+            if not item:
+                continue
+            job_id, ok, value = item
+            if job_id == "died":
+                self._fail_dead(ok, value)
+                continue
+            with self._lock:
+                fut = self._futures.pop(job_id, None)
+            if fut is None:
+                continue
+            if ok:
+                fut.set_result(value)
+            else:
+                fut.set_exception(RuntimeError(f"replica job failed: {value}"))
+
+    def _reap(self):
+        # a result the dead replica sent before exiting is already in the queue; the marker goes
+        # in behind it, so its job is only failed if that result never came
+        if self._closing:
+            return
+        for i, proc in enumerate(self._procs):
+            if i not in self._dead and not proc.is_alive():
+                self._dead.add(i)
+                print(f"[replicas] Replica {i} died (exit code {proc.exitcode})")
+                self._results.put(("died", i, proc.exitcode))
+
+    def _fail_dead(self, index, exitcode):
+        # the job the dead replica had taken fails; with no replica left, everything pending does
+        error = RuntimeError(f"replica {index} died (exit code {exitcode})")
+        with self._lock:
+            futures = [self._futures.pop(self._current[index].value, None)]
+            if len(self._dead) == len(self._procs):
+                futures += list(self._futures.values())
+                self._futures.clear()
+        for fut in futures:
+            if fut is not None:
+                fut.set_exception(error)
+
+    def submit(self, method, *args, cancellable=False, **kwargs) -> Future:
+        """Queue method(*args, **kwargs); a cancellable job also gets a `cancel` keyword (see cancel())."""
+        fut = Future()
+        job_id = next(self._ids)
+        with self._lock:
+            if self._procs and len(self._dead) == len(self._procs):
+                fut.set_exception(RuntimeError("no replica is alive"))
+                return fut
+            self._futures[job_id] = fut
+        self._jobs.put((job_id, method, args, kwargs, cancellable))
+        return fut
+
+    def cancel(self, fut):
+        """Cancel a submitted job: skipped if still queued, stopped at its next token if cancellable and running."""
+        with self._lock:
+            job_id = next((j for j, f in self._futures.items() if f is fut), None)
+            if job_id is None:
+                return False
+            del self._futures[job_id]
+        for control in self._controls:
+            control.put(job_id)
+        return fut.cancel()
+
+    def _wait(self, futures, cancel):
+        # poll cancel() while the jobs run, then cancel everything still outstanding
+        if cancel is not None:
+            pending = set(futures)
+            while pending:
+                if cancel():
+                    for f in futures:
+                        self.cancel(f)
+                    break
+                pending = wait(pending, timeout=0.05).not_done
+        return [f.result() for f in futures]
+
+    def run(self, method, *args, cancel=None, **kwargs):
+        """method(*args, **kwargs) on the next free replica; CancelledError once cancel() returns True."""
+        return self._wait([self.submit(method, *args, cancellable=cancel is not None, **kwargs)], cancel)[0]
+
+    def map(self, method, arg_list, cancel=None, **kwargs):
+        """Run method(*args, **kwargs) for each args tuple; results in submission order."""
+        futures = [self.submit(method, *args, cancellable=cancel is not None, **kwargs) for args in arg_list]
+        return self._wait(futures, cancel)
+
+    def close(self):
+        self._closing = True
+        for _ in self._procs:
+            self._jobs.put(None)
+        for control in self._controls:
+            control.put(None)
+        for proc in self._procs:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+        self._results.put(None)
+        self._procs = []
@@ -0,0 +1,204 @@
+# generator/similarity.py
+import os
+import re
+import random
+import hashlib
+import threading
+from collections import OrderedDict, deque
+
+# Jaccard similarity of normalized descriptions needed to reuse a result; 0 leaves the cache off
+SIMILARITY_THRESHOLD = float(os.getenv("CODEGEN_SIMILARITY_THRESHOLD", "0") or 0)
+SIMILARITY_MAX_ENTRIES = int(os.getenv("CODEGEN_SIMILARITY_MAX_ENTRIES", "2048") or 2048)
+# fraction of hits that are regenerated anyway to measure how often a match was wrong
+SIMILARITY_AUDIT_RATE = float(os.getenv("CODEGEN_SIMILARITY_AUDIT_RATE", "0") or 0)
+
+_WORD = re.compile(r"[a-z0-9_]+")
+# words that never change what code is asked for
+_FILLER = frozenset("a an the please that which me some just simple".split())
+# exact details two descriptions must share: signatures, names, numbers, quoted literals
+_SALIENT = re.compile(r"\([^()]*\)|`[^`]*`|'[^']*'|\"[^\"]*\"|\b(?i:def|class|named)\s+\w+|"
+                      r"\b\w*[\d_]\w*\b|\b[a-z]+[A-Z]\w*\b")
+_MERSENNE = (1 << 61) - 1
+
+
+def normalize(description: str):
+    """Lowercased words without punctuation, filler words or a plural "s"."""
+    words = []
+    for w in _WORD.findall(description.lower()):
+        if w in _FILLER:
+            continue
+        if len(w) > 3 and w.endswith("s") and not w.endswith("ss"):
+            w = w[:-1]
+        words.append(w)
+    return words
+
+
+def salient(description: str):
+    return frozenset(re.sub(r"\s+", "", s).lower() for s in _SALIENT.findall(description))
+
+
+def shingles(words):
+    # words and word pairs: pairs keep "celsius to fahrenheit" apart from "fahrenheit to celsius"
+    return frozenset(words) | frozenset(f"{a} {b}" for a, b in zip(words, words[1:]))
+
+
+class SimilarityCache:
+    """Reuses results across near-duplicate descriptions.
+
+    Descriptions are normalized into word and word-pair shingles and indexed
+    with MinHash/LSH, one index per namespace (model, lang, mode, budget).
+    LSH only proposes candidates; a candidate is a hit when the exact Jaccard
+    similarity reaches `threshold` and both descriptions carry the same salient
+    details (signatures, names, numbers, quoted text). The caller's validator
+    runs on every hit, and entries that fail it are dropped. At most
+    max_entries results are kept, least recently used evicted first.
+
+    `audit_rate` of hits are flagged by should_audit(); the caller regenerates
+    them and reports back through record_audit(), which counts mismatches and
+    keeps the latest ones in self.audits.
+    """
+
+    def __init__(self, threshold: float = None, max_entries: int = SIMILARITY_MAX_ENTRIES,
+                 audit_rate: float = SIMILARITY_AUDIT_RATE, num_perm: int = 64, bands: int = 16, seed: int = 1):
+        self.threshold = threshold or SIMILARITY_THRESHOLD or 0.8
+        self.max_entries = max_entries
+        self.audit_rate = audit_rate
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = random.Random(seed)
+        self._perms = [(rng.randrange(1, _MERSENNE), rng.randrange(0, _MERSENNE)) for _ in range(bands * self.rows)]
+        self._entries = OrderedDict()  # id -> (namespace, shingles, salient, bucket keys, description, result)
+        self._buckets = {}  # (namespace, band, band hash) -> set of ids
+        self._exact = {}  # (namespace, normalized text) -> id
+        self._next_id = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.audits = deque(maxlen=100)
+        self.stats = {"lookups": 0, "hits": 0, "misses": 0, "rejected_invalid": 0, "entries": 0, "evictions": 0,
+                      "audited": 0, "audit_mismatches": 0}
+
+    def _signature(self, items):
+        hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little")
+                  for s in items]
+        return [min((a * h + b) % _MERSENNE for h in hashes) for a, b in self._perms]
+
+    def _bucket_keys(self, namespace, items):
+        sig = self._signature(items)
+        r = self.rows
+        return [(namespace, band, hash(tuple(sig[band * r:(band + 1) * r]))) for band in range(self.bands)]
+
+    def get(self, namespace, description, validate):
+        """The best stored match as {"result", "similarity", "matched"}, or None.
+
+        `validate(code) -> (valid, msg)` is the language's validator; a stored
+        result that no longer passes it is never returned.
+        """
+        words = normalize(description)
+        items = shingles(words)
+        with self._lock:
+            self.stats["lookups"] += 1
+        if not items:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        keys = self._bucket_keys(namespace, items)
+        details = salient(description)
+
+        with self._lock:
+            exact = self._exact.get((namespace, " ".join(words)))
+            candidates = set() if exact is None else {exact}
+            for key in keys:
+                candidates |= self._buckets.get(key, set())
+            scored = []
+            for entry_id in candidates:
+                _, stored, stored_details, _, matched, result = self._entries[entry_id]
+                if stored_details != details:
+                    continue
+                similarity = len(items & stored) / len(items | stored)
+                if similarity >= self.threshold:
+                    scored.append((similarity, entry_id, matched, result))
+        scored.sort(key=lambda s: s[0], reverse=True)
+
+        for similarity, entry_id, matched, result in scored:
+            valid, _ = validate(result.get("formatted_code") or "")
+            with self._lock:
+                if not valid:
+                    self.stats["rejected_invalid"] += 1
+                    self._remove(entry_id)
+                    continue
+                if entry_id in self._entries:
+                    self._entries.move_to_end(entry_id)
+                self.stats["hits"] += 1
+            return {"result": dict(result), "similarity": round(similarity, 4), "matched": matched}
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, namespace, description, result):
+        words = normalize(description)
+        items = shingles(words)
+        if not items:
+            return
+        keys = self._bucket_keys(namespace, items)
+        with self._lock:
+            previous = self._exact.get((namespace, " ".join(words)))
+            if previous is not None:
+                self._remove(previous)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (namespace, items, salient(description), keys, description, dict(result))
+            self._exact[(namespace, " ".join(words))] = entry_id
+            for key in keys:
+                self._buckets.setdefault(key, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+            self.stats["entries"] = len(self._entries)
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        namespace, _, _, keys, description, _ = entry
+        for key in keys:
+            ids = self._buckets.get(key)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self._buckets[key]
+        exact = (namespace, " ".join(normalize(description)))
+        if self._exact.get(exact) == entry_id:
+            del self._exact[exact]
+        self.stats["entries"] = len(self._entries)
+
+    def should_audit(self):
+        if self.audit_rate <= 0:
+            return False
+        with self._lock:
+            return self._rng.random() < self.audit_rate
+
+    def record_audit(self, description, hit, result):
+        """Compare a regenerated `result` with the cached `hit` it would have been served."""
+        mismatch = (hit["result"].get("formatted_code") or "").strip() != (result.get("formatted_code") or "").strip()
+        with self._lock:
+            self.stats["audited"] += 1
+            if mismatch:
+                self.stats["audit_mismatches"] += 1
+                self.audits.append({"description": description, "matched": hit["matched"],
+                                    "similarity": hit["similarity"]})
+        return mismatch
+
+    def report(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["hit_rate"] = round(stats["hits"] / stats["lookups"], 4) if stats["lookups"] else 0.0
+        stats["false_match_rate"] = round(stats["audit_mismatches"] / stats["audited"], 4) if stats["audited"] \
+            else None
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            self._exact.clear()
+            self.stats["entries"] = 0
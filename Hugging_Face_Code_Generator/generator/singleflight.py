@@ -0,0 +1,115 @@
+# generator/singleflight.py
+import copy
+import threading
+import time
+from concurrent.futures import Future, CancelledError, wait
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls that share a key.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is running (followers) wait for the same result and get a
+    deep copy of it. Each follower waits on its own future, so a follower that
+    times out or is cancelled just detaches; the leader and the other followers
+    are unaffected.
+    """
+
+    def __init__(self):
+        self._calls = {}  # key -> leader Future
+        self._followers = {}  # key -> follower Futures
+        self._lock = threading.Lock()
+        self.stats = {"leaders": 0, "coalesced": 0, "abandoned": 0}
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def waiting(self, key):
+        """How many followers are still waiting on key's leader."""
+        with self._lock:
+            return sum(not f.done() for f in self._followers.get(key, ()))
+
+    def join(self, key):
+        """Return (future, is_leader). The leader must call finish(key, future, ...) when done;
+        followers get a private future that resolves to a copy of the leader's result."""
+        with self._lock:
+            leader = self._calls.get(key)
+            if leader is None:
+                fut = self._calls[key] = Future()
+                self.stats["leaders"] += 1
+                return fut, True
+            self.stats["coalesced"] += 1
+            mine = self._follow(leader)
+            self._followers.setdefault(key, []).append(mine)
+        return mine, False
+
+    def _follow(self, leader):
+        mine = Future()
+
+        def relay(done):
+            if mine.cancelled():
+                return
+            try:
+                if done.exception() is not None:
+                    mine.set_exception(done.exception())
+                else:
+                    mine.set_result(copy.deepcopy(done.result()))
+            except CancelledError:
+                mine.cancel()
+            except Exception as e:  # set_* after a concurrent cancel, or an uncopyable result
+                if not mine.done():
+                    mine.set_exception(e)
+
+        leader.add_done_callback(relay)
+        return mine
+
+    def finish(self, key, fut, result=None, error=None):
+        with self._lock:
+            if self._calls.get(key) is fut:
+                del self._calls[key]
+                self._followers.pop(key, None)
+        if error is not None:
+            fut.set_exception(error)
+        else:
+            fut.set_result(result)
+
+    def abandon(self, fut):
+        """Detach a follower (timeout or cancellation); the leader keeps running."""
+        with self._lock:
+            self.stats["abandoned"] += 1
+        fut.cancel()
+
+    def do(self, key, fn, timeout: float = None, cancel=None):
+        """Run fn() once per concurrent key. Returns (result, is_leader).
+
+        Followers raise concurrent.futures.TimeoutError after `timeout` seconds,
+        and CancelledError once `cancel()` returns True; the leader ignores both,
+        since its result is what the followers wait for (fn polls its own cancel).
+        """
+        fut, leader = self.join(key)
+        if leader:
+            try:
+                result = fn()
+            except BaseException as e:
+                self.finish(key, fut, error=e)
+                raise
+            self.finish(key, fut, result)
+            return result, True
+        try:
+            if cancel is None:
+                return fut.result(timeout=timeout), False
+            # poll cancel() while waiting, like ReplicaPool._wait
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not fut.done():
+                if cancel():
+                    raise CancelledError()
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError()
+                wait([fut], timeout=0.05 if remaining is None else min(0.05, remaining))
+            return fut.result(), False
+        except BaseException:
+            if not fut.done():
+                self.abandon(fut)
+            raise
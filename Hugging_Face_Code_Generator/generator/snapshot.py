@@ -0,0 +1,115 @@
+# generator/snapshot.py
+import os
+import json
+import time
+
+# prepared snapshots live here, one directory per (model, precision)
+SNAPSHOT_DIR = os.getenv("CODEGEN_SNAPSHOT_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "codegen",
+                                                                  "snapshots")
+MARKER = "codegen_snapshot.json"
+
+
+def snapshot_path(model_name: str, dtype: str = None, root: str = None) -> str:
+    name = model_name.strip("/\\").replace("/", "--").replace("\\", "--").replace(":", "")
+    return os.path.join(root or SNAPSHOT_DIR, f"{name}-{dtype or 'default'}")
+
+
+def find_snapshot(model_name: str, dtype: str = None, root: str = None):
+    """Return the prepared snapshot directory for (model_name, dtype), or None.
+
+    A model_name that is itself a snapshot directory (prepared with an explicit
+    output path) is returned as is."""
+    if os.path.isfile(os.path.join(model_name, MARKER)):
+        return model_name
+    path = snapshot_path(model_name, dtype, root)
+    try:
+        with open(os.path.join(path, MARKER), "r", encoding="utf-8") as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return path if info.get("source") == model_name else None
+
+
+def prepare_snapshot(model_name: str, dtype: str = None, root: str = None, output: str = None) -> str:
+    """Convert a model once into a directory CodeGenModel can load quickly.
+
+    Weights are saved as safetensors already cast to `dtype` (memory-mapped at
+    load time, no conversion pass), and the tokenizer is saved as a fast
+    tokenizer.json so the slow Python tokenizer is never built again. int8 is
+    applied at load time (dynamic quantization), so its snapshot holds fp32
+    weights. Returns the snapshot directory.
+    """
+    import torch
+    from transformers import AutoTokenizer, AutoModelForCausalLM
+    from generator.models import normalize_precision
+
+    dtype = normalize_precision(dtype)
+    path = output or snapshot_path(model_name, dtype, root)
+    os.makedirs(path, exist_ok=True)
+    start = time.perf_counter()
+
+    try:
+        tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+    except Exception as e:
+        print(f"[snapshot] Fast tokenizer conversion failed, keeping the slow one: {e}")
+        tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=False)
+    torch_dtype = torch.float32 if dtype == "int8" else (getattr(torch, dtype) if dtype else None)
+    model = AutoModelForCausalLM.from_pretrained(model_name, low_cpu_mem_usage=True, torch_dtype=torch_dtype)
+
+    # marker goes last, so an interrupted prepare never looks complete
+    marker = os.path.join(path, MARKER)
+    if os.path.exists(marker):
+        os.remove(marker)
+    model.save_pretrained(path, safe_serialization=True)
+    tokenizer.save_pretrained(path)
+    with open(marker, "w", encoding="utf-8") as f:
+        json.dump({"source": model_name, "dtype": dtype, "fast_tokenizer": bool(getattr(tokenizer, "is_fast", False)),
+                   "created": time.time()}, f)
+    print(f"[snapshot] {model_name} ({dtype or 'default'}) -> {path} in {time.perf_counter() - start:.1f}s")
+    return path
+
+
+def load_snapshot(path: str):
+    """Load (tokenizer, model) from a prepared snapshot on CPU.
+
+    Skips the Auto* class resolution and from_pretrained's per-tensor loading:
+    the model class named in config.json is built without weight init and the
+    memory-mapped safetensors are assigned to it as they are. Falls back to
+    from_pretrained if the checkpoint doesn't match the model exactly.
+    """
+    import glob
+    import transformers
+    from transformers import PreTrainedTokenizerFast
+
+    with open(os.path.join(path, "config.json"), "r", encoding="utf-8") as f:
+        arch = (json.load(f).get("architectures") or [None])[0]
+    cls = getattr(transformers, arch) if arch else None
+    if os.path.exists(os.path.join(path, "tokenizer.json")):
+        tokenizer = PreTrainedTokenizerFast.from_pretrained(path)
+    else:
+        tokenizer = transformers.AutoTokenizer.from_pretrained(path)
+    if cls is None:
+        return tokenizer, transformers.AutoModelForCausalLM.from_pretrained(path, low_cpu_mem_usage=True)
+
+    try:
+        from safetensors.torch import load_file
+        try:
+            from transformers.initialization import no_init_weights
+        except ImportError:
+            from transformers.modeling_utils import no_init_weights
+        with no_init_weights():
+            model = cls(cls.config_class.from_pretrained(path))
+        state = {}
+        for shard in sorted(glob.glob(os.path.join(path, "*.safetensors"))):
+            state.update(load_file(shard))
+        missing, unexpected = model.load_state_dict(state, strict=False, assign=True)
+        tied = set(getattr(model, "_tied_weights_keys", None) or ())
+        if unexpected or set(missing) - tied:
+            raise ValueError(f"missing={missing} unexpected={unexpected}")
+        model.tie_weights()
+        if os.path.exists(os.path.join(path, "generation_config.json")):
+            model.generation_config = transformers.GenerationConfig.from_pretrained(path)
+    except Exception as e:
+        print(f"[snapshot] Direct load failed, using from_pretrained: {e}")
+        model = cls.from_pretrained(path, low_cpu_mem_usage=True)
+    return tokenizer, model
@@ -0,0 +1,169 @@
+# generator/stopping.py
+import re
+import ast
+
+from generator.languages import canonical_name
+
+_FENCE = re.compile(r"```")
+_TOP_LEVEL = re.compile(r"^[^\s#]")
+# a ";" ending its line, outside string literals, quoted identifiers and comments (unterminated ones run to the end)
+_SQL_END = re.compile(r"'[^']*(?:'|\Z)|\"[^\"]*(?:\"|\Z)|`[^`]*(?:`|\Z)|--[^\n]*|/\*(?:.*?\*/|.*\Z)|(;)[^\S\n]*(?:\n|\Z)",
+                      flags=re.S)
+# lines like "}" or ");" legitimately repeat when blocks close
+_PUNCTUATION_ONLY = re.compile(r"[^\w]*")
+_CODE_START = re.compile(r"^(?:def|class|from|import|@)\s?", flags=re.M)
+
+
+def find_stop(text: str, lang: str = "python", mode: str = "function"):
+    """Return (offset, reason) once `text` (the completion so far) holds a finished
+    code unit, or None to keep generating.
+
+    The rules mirror what sanitize_code/postprocess_and_format keep anyway:
+    text after a closing fence, a second top-level definition once the first
+    one parses, anything after a terminated SQL statement, repeated lines, and
+    the language plugin's stop_sequences. `offset` is where the kept text ends; everything after it would be dropped.
+    """
+    lang = canonical_name(lang) or (lang or "python").lower()
+
+    # the language plugin's own markers (e.g. the model restating the prompt)
+    hits = [i for i in (text.find(seq) for seq in _stop_sequences(lang)) if i != -1]
+    marker = min(hits) if hits else None
+
+    # closing fence: sanitize_code only keeps what is inside the first block
+    fences = [m.start() for m in _FENCE.finditer(text)]
+    if len(fences) >= 2 and (marker is None or fences[1] + 3 <= marker):
+        return fences[1] + 3, "fence"
+    if marker is not None:
+        return marker, "stop_sequence"
+
+    if lang == "sql" or mode == "sql":
+        for m in _SQL_END.finditer(text):
+            if m.group(1):
+                return m.start() + 1, "sql_terminator"
+
+    rep = _repetition(text)
+    if rep is not None:
+        return rep, "repetition"
+
+    if lang == "python" and mode in ("function", "class") and not fences:
+        return _python_unit_end(text)
+    return None
+
+
+_plugin_stops = {}
+
+
+def _stop_sequences(lang):
+    seqs = _plugin_stops.get(lang)
+    if seqs is None:
+        from generator.languages import get_language
+        plugin = get_language(lang)
+        seqs = _plugin_stops[lang] = tuple(getattr(plugin, "stop_sequences", ()))
+    return seqs
+
+
+def _python_unit_end(text):
+    start = _CODE_START.search(text)
+    if not start:
+        return None
+    # the last line may still be growing, but its first character is enough to
+    # tell that a new top-level statement has started
+    body = text[start.start():]
+    lines = body.splitlines(keepends=True)
+    seen_def = False
+    seen_body = False
+    offset = 0
+    for ln in lines:
+        stripped = ln.strip()
+        if seen_body and stripped and not ln[0].isspace() and _TOP_LEVEL.match(ln):
+            try:
+                ast.parse(body[:offset])
+            except SyntaxError:
+                return None
+            return start.start() + offset, "complete_unit"
+        if re.match(r"(?:async\s+)?def\s|class\s", stripped) and not ln[0].isspace():
+            seen_def = True
+        elif seen_def and stripped and ln[0].isspace():
+            seen_body = True
+        offset += len(ln)
+    return None
+
+
+def _repetition(text, min_repeats: int = 4):
+    # the same line many times in a row means the model is looping; lines without a word never count
+    lines = text.splitlines(keepends=True)
+    run, prev, offset, kept = 0, None, 0, 0
+    for ln in lines[:-1]:  # last line may be incomplete
+        stripped = ln.strip()
+        if stripped and stripped == prev and not _PUNCTUATION_ONLY.fullmatch(stripped):
+            run += 1
+            if run + 1 >= min_repeats:
+                return kept
+        else:
+            run = 0
+            prev = stripped
+            kept = offset + len(ln)
+        offset += len(ln)
+    return None
+
+
+def make_stopping_criteria(tokenizer, prompt_len: int, lang: str, mode: str, check_every: int = 1):
+    """Build a transformers StoppingCriteria that applies find_stop per row.
+
+    Decoding only covers the generated part of each row. Rows that finish are
+    recorded in `criteria.stops` as {row: (offset, reason, new_tokens)}.
+    """
+    import torch
+    from transformers import StoppingCriteria
+
+    class CodeUnitStoppingCriteria(StoppingCriteria):
+        def __init__(self):
+            self.stops = {}
+            self._steps = 0
+
+        def __call__(self, input_ids, scores, **kwargs):
+            self._steps += 1
+            done = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+            for row in range(input_ids.shape[0]):
+                if row in self.stops:
+                    done[row] = True
+                    continue
+                if self._steps % check_every:
+                    continue
+                new_ids = input_ids[row, prompt_len:]
+                hit = find_stop(tokenizer.decode(new_ids, skip_special_tokens=True), lang=lang, mode=mode)
+                if hit is not None:
+                    self.stops[row] = (hit[0], hit[1], int(new_ids.shape[0]))
+                    done[row] = True
+            return done
+
+    return CodeUnitStoppingCriteria()
+
+
+def make_first_token_timer():
+    """A StoppingCriteria that never stops; it records when the first new token exists."""
+    import time
+    from transformers import StoppingCriteria
+
+    class FirstTokenTimer(StoppingCriteria):
+        def __init__(self):
+            self.first_token_at = None
+
+        def __call__(self, input_ids, scores, **kwargs):
+            if self.first_token_at is None:
+                self.first_token_at = time.perf_counter()
+            return False
+
+    return FirstTokenTimer()
+
+
+def make_cancel_criteria(cancel):
+    """A StoppingCriteria that ends every row as soon as cancel() returns True."""
+    import torch
+    from transformers import StoppingCriteria
+
+    class CancelCriteria(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return torch.full((input_ids.shape[0],), bool(cancel()), dtype=torch.bool, device=input_ids.device)
+
+    return CancelCriteria()
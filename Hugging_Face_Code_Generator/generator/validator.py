@@ -1,19 +1,158 @@
 # generator/validator.py
+import os
+import sys
 import ast
+import hashlib
+import threading
+from collections import OrderedDict
 
-def validate_python(code: str):
+# results are cached per (lang, code hash); 0 disables the cache
+CACHE_SIZE = int(os.getenv("CODEGEN_VALIDATION_CACHE", "4096") or 0)
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+_local = threading.local()
+stats = {"hits": 0, "misses": 0, "prechecked": 0, "parsed": 0}
+
+_OPENERS = {")": "(", "]": "[", "}": "{"}
+# PEP 701: from 3.12 an f-string may reuse its own quote inside {...}
+_NESTED_FSTRINGS = sys.version_info >= (3, 12)
+
+
+def precheck(code: str, lang: str = "python"):
+    """Cheap single scan for errors the real parser is certain to report.
+
+    Looks for a markdown fence line, a closing bracket without its opener, and
+    brackets or strings still open at the end, skipping strings and comments.
+    Returns an error message, or None when the full parser has to decide (also
+    whenever the scan can't be sure, e.g. JS template or regex literals).
+    """
+    js = lang != "python"
+    stack = []
+    i, n, line = 0, len(code), 1
+    at_line_start = True
+    while i < n:
+        c = code[i]
+        if at_line_start and code.startswith("```", i):
+            return f"markdown fence at line {line}"
+        at_line_start = False
+        if c == "\n":
+            line += 1
+            at_line_start = True
+        elif c in "([{":
+            stack.append((c, line))
+        elif c in ")]}":
+            if not stack or stack[-1][0] != _OPENERS[c]:
+                return f"unmatched '{c}' at line {line}"
+            stack.pop()
+        elif c == "#" and not js:
+            end = code.find("\n", i)
+            i = n if end == -1 else end
+            continue
+        elif c == "/" and js:
+            if code.startswith("//", i):
+                end = code.find("\n", i)
+                i = n if end == -1 else end
+                continue
+            if code.startswith("/*", i):
+                end = code.find("*/", i + 2)
+                if end == -1:
+                    return f"unterminated comment at line {line}"
+                line += code.count("\n", i, end)
+                i = end + 2
+                continue
+            return None  # division or regex literal: leave it to the parser
+        elif c == "`" and js:
+            return None  # template literals can nest code
+        elif c in "'\"":
+            if _NESTED_FSTRINGS and not js and "f" in code[max(0, i - 2):i].lower():
+                return None
+            quote = code[i:i + 3] if not js and code.startswith(c * 3, i) else c
+            j = i + len(quote)
+            while True:
+                if j >= n:
+                    return f"unterminated string starting at line {line}"
+                if code[j] == "\\":
+                    j += 2
+                    continue
+                if len(quote) == 1 and code[j] == "\n":
+                    return f"unterminated string at line {line}"
+                if code.startswith(quote, j):
+                    break
+                j += 1
+            line += code.count("\n", i, j)
+            i = j + len(quote)
+            continue
+        i += 1
+    if stack:
+        c, at = stack[-1]
+        return f"'{c}' opened at line {at} was never closed"
+    return None
+
+
+def _parse_python(code):
     try:
         ast.parse(code)
         return True, "Valid Python Syntax"
     except SyntaxError as e:
         return False, f"invalid syntax: {e}"
+    except ValueError as e:  # e.g. null bytes
+        return False, f"invalid syntax: {e}"
 
 
-def validate_js(code: str):
-    try:
+def _parse_js(code):
+    # one parser per thread; PyJsParser resets its state on every parse()
+    parser = getattr(_local, "js_parser", None)
+    if parser is None:
         from pyjsparser import PyJsParser
-        parser = PyJsParser()
+        parser = _local.js_parser = PyJsParser()
+    try:
         parser.parse(code)
         return True, "Valid JS Syntax"
     except Exception as e:
         return False, str(e)
+
+
+_PARSERS = {"python": _parse_python, "javascript": _parse_js}
+_PREFIX = {"python": "invalid syntax: ", "javascript": ""}
+
+
+def validate(code: str, lang: str = "python"):
+    """(valid, message) for `code`: cached by hash, pre-checked, then parsed at most once."""
+    key = (lang, hashlib.blake2b(code.encode("utf-8", "surrogatepass"), digest_size=16).digest())
+    with _lock:
+        result = _cache.get(key)
+        if result is not None:
+            _cache.move_to_end(key)
+            stats["hits"] += 1
+            return result
+        stats["misses"] += 1
+
+    problem = precheck(code, lang)
+    if problem is not None:
+        result = (False, _PREFIX[lang] + problem)
+        counter = "prechecked"
+    else:
+        result = _PARSERS[lang](code)
+        counter = "parsed"
+
+    with _lock:
+        stats[counter] += 1
+        if CACHE_SIZE > 0:
+            _cache[key] = result
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+    return result
+
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
+
+
+def validate_python(code: str):
+    return validate(code, "python")
+
+
+def validate_js(code: str):
+    return validate(code, "javascript")
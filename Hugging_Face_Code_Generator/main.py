@@ -4,27 +4,61 @@ import sys
 import traceback
 import os
 import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, CancelledError
 
 from generator.validator import validate_python, validate_js
-from generator.formatter import format_python, format_js, postprocess_and_format
-from generator.prompts import function_prompt, class_prompt, api_prompt, test_prompt, sql_prompt
+from generator.formatter import (format_python, format_js, postprocess_and_format, postprocess_many, postprocess_best,
+                                 sanitize_code, IncrementalSanitizer, VALIDATION_BUDGET)
+from generator.prompts import function_prompt, class_prompt, api_prompt, test_prompt, prompt_prefix
+from generator.languages import get_language, canonical_name
+from generator.cache import ResultCache, make_key
+from generator.metrics import Trace, timed, emit
+from generator.singleflight import SingleFlight
+from generator.similarity import SimilarityCache, SIMILARITY_THRESHOLD
+from generator.budget import TokenBudget, ADAPTIVE_BUDGET, DEFAULT_MAX_NEW_TOKENS
 
 # Try to import the real model; if it fails, use a dummy fallback so main.py still produces output.
 USE_REAL_MODEL = True
 try:
-    from generator.models import CodeGenModel
+    from generator.models import CodeGenModel, normalize_precision
+    from generator.registry import get_model
 except Exception as e:
     print("Warning: Could not import CodeGenModel from generator.models. Falling back to dummy generator.")
     print("Import error:", e)
     USE_REAL_MODEL = False
 
 
+# prompt templates for languages without a plugin (see generator/languages)
+_GENERIC_PROMPTS = {"function": function_prompt, "class": class_prompt, "api": api_prompt, "test": test_prompt}
+
+
 # Dummy model used when the real model can't be loaded.
 class DummyModel:
-    def __init__(self, *args, **kwargs):
-        pass
+    # generate() returns only the completion, like generate_stream()
+    echoes_prompt = False
+
+    def __init__(self, *args, token_delay: float = None, **kwargs):
+        # seconds per generated token, so load tests can mimic decode time without weights
+        self.token_delay = float(os.getenv("CODEGEN_DUMMY_TOKEN_DELAY", "0") or 0) if token_delay is None \
+            else token_delay
 
-    def generate(self, prompt, max_new_tokens=256, temperature=0.0, top_p=1.0):
+    def _decode_delay(self, texts, max_new_tokens, cancel=None):
+        # ~4 characters per token; a batch takes as many steps as its longest row
+        if self.token_delay <= 0:
+            return
+        for _ in range(min(max_new_tokens, max(len(t) for t in texts) // 4)):
+            if cancel is not None and cancel():
+                return
+            time.sleep(self.token_delay)
+
+    def generate(self, prompt, max_new_tokens=256, temperature=0.0, top_p=1.0, **kwargs):
+        text = self._complete(prompt)[:max_new_tokens * 4]
+        self._decode_delay([text], max_new_tokens, kwargs.get("cancel"))
+        return text
+
+    def _complete(self, prompt):
         # Very simple heuristic: check prompt keywords to return plausible code.
         p = prompt.lower()
         if ("def add" in p) or (("python" in p) and ("function" in p)) or ("def " in p and "add" in p):
@@ -72,136 +106,579 @@ class DummyModel:
                 "    return None\n"
             )
 
+    def generate_batch(self, prompts, max_new_tokens=256, temperature=0.0, top_p=1.0, batch_size=8, **kwargs):
+        texts = [self._complete(p)[:max_new_tokens * 4] for p in prompts]
+        step = max(1, batch_size)
+        for start in range(0, len(texts), step):
+            self._decode_delay(texts[start:start + step], max_new_tokens, kwargs.get("cancel"))
+        return texts
+
+    def generate_candidates(self, prompt, n=4, max_new_tokens=256, temperature=0.8, top_p=0.95, **kwargs):
+        # deterministic, so every "sample" is the same
+        return [self.generate(prompt, max_new_tokens=max_new_tokens, cancel=kwargs.get("cancel"))] * n
+
+    def generate_stream(self, prompt, max_new_tokens=256, temperature=0.0, top_p=1.0, **kwargs):
+        # one chunk per line, roughly how a tokenizer streamer would surface text
+        for line in self._complete(prompt)[:max_new_tokens * 4].splitlines(keepends=True):
+            self._decode_delay([line], max_new_tokens)
+            yield line
+
 
 class CodeGenerator:
     # Use environment variable CODEGEN_MODEL if set, otherwise default to a public HF model
     DEFAULT_MODEL = os.getenv("CODEGEN_MODEL", "Salesforce/codegen-350M-multi")
 
-    def __init__(self, model_name: str = None):
-        model_name = model_name or self.DEFAULT_MODEL
+    def __init__(self, model_name: str = None, device: str = None, dtype: str = None, cache=None,
+                 replicas: int = None, best_of: int = None, coalesce: bool = True, max_concurrency: int = None,
+                 similar=None, budget=None):
+        self.model_name = model_name or self.DEFAULT_MODEL
+        self.device = device
+        # precision: fp32 / bf16 / fp16 / int8, defaulting to CODEGEN_PRECISION
+        self.dtype = dtype or os.getenv("CODEGEN_PRECISION") or None
+        # >1 runs generate/generate_batch in that many model replica processes (see generator/replicas.py)
+        self.replicas = int(os.getenv("CODEGEN_REPLICAS", "0") or 0) if replicas is None else replicas
+        self._pool = None
+        # >1 samples that many candidates per generate() and keeps the first valid one
+        self.best_of = int(os.getenv("CODEGEN_BEST_OF", "1") or 1) if best_of is None else best_of
+        # concurrent identical generate() calls share one model call; counters in self.inflight.stats
+        self.inflight = SingleFlight() if coalesce else None
+        # agenerate/agenerate_batch run on a private thread pool of this many workers
+        self.max_concurrency = int(os.getenv("CODEGEN_MAX_CONCURRENCY", "1") or 1) if max_concurrency is None \
+            else max_concurrency
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        # generations are greedy, so results can be reused; pass cache=False to disable
+        self.cache = ResultCache() if cache is None else (cache or None)
+        # near-duplicate descriptions reuse a validated result (generator/similarity.py); pass True or a
+        # SimilarityCache to enable, otherwise it is on only when CODEGEN_SIMILARITY_THRESHOLD is set
+        if similar is None:
+            similar = SIMILARITY_THRESHOLD > 0
+        self.similar = SimilarityCache() if similar is True else (similar or None)
+        # calls without max_new_tokens get a budget learned from past output lengths (generator/budget.py);
+        # pass True or a TokenBudget to enable, otherwise it is on only when CODEGEN_ADAPTIVE_BUDGET is set
+        if budget is None:
+            budget = ADAPTIVE_BUDGET
+        self.budget = TokenBudget() if budget is True else (budget or None)
+        # loaded on first use, so constructing a generator never touches torch/transformers
+        self._model = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = self._load_model()
+        return self._model
 
+    @model.setter
+    def model(self, value):
+        self._model = value
+
+    def _load_model(self):
         if USE_REAL_MODEL:
             try:
-                self.model = CodeGenModel(model_name)
-                print(f"Loaded real model: {model_name}")
+                # shared per (model_name, device, dtype), so repeated generators reuse loaded weights
+                model = get_model(self.model_name, device=self.device, dtype=self.dtype)
+                print(f"Loaded real model: {self.model_name}")
+                return model
             except Exception:
                 print("Failed to initialize real model, switching to DummyModel. Error:")
                 traceback.print_exc()
-                self.model = DummyModel()
-        else:
-            self.model = DummyModel()
+                return DummyModel()
+        return DummyModel()
 
-    def generate(self, description, mode="function", lang="python", max_new_tokens=256):
+    def _prompt_builder(self, mode="function", lang="python"):
+        # SQL has a single template; other languages look the mode up in their plugin's table
+        plugin = get_language("sql" if mode == "sql" else lang)
+        if plugin is None:
+            return _GENERIC_PROMPTS.get(mode, function_prompt), (lang,)
+        return plugin.prompts.get(mode) or plugin.prompts[plugin.default_mode]
+
+    def _build_prompt(self, description, mode="function", lang="python"):
+        builder, args = self._prompt_builder(mode=mode, lang=lang)
+        return builder(description, *args)
+
+    def _prompt_prefix(self, mode="function", lang="python"):
+        # constant template header, reused across calls through the model's KV prefix cache
+        builder, args = self._prompt_builder(mode=mode, lang=lang)
+        return prompt_prefix(builder, *args)
+
+    def generate(self, description, mode="function", lang="python", max_new_tokens=None, best_of=None,
+                 timeout=None, cancel=None):
         """Build prompt, call model, sanitize/format the result and provide
-        a safe deterministic fallback if the model output is empty or invalid."""
-
-        # Build prompt mapping
-        if mode == "function":
-            prompt = function_prompt(description, lang)
-        elif mode == "class":
-            prompt = class_prompt(description, lang)
-        elif mode == "api":
-            prompt = api_prompt(description, lang)
-        elif mode == "test":
-            prompt = test_prompt(description, lang)
-        else:
-            prompt = function_prompt(description, lang)
+        a safe deterministic fallback if the model output is empty or invalid.
 
-        # For SQL language, override prompt to sql_prompt
-        if lang.lower() == "sql" or mode == "sql":
-            prompt = sql_prompt(description)
+        With best_of > 1, that many candidates are sampled in one model call and
+        the first one that validates is returned (see _generate_best_of).
+        Identical calls already in flight on other threads are joined instead of
+        repeated; `timeout` bounds how long such a joined call waits (the call
+        doing the work is never interrupted).
+        Without max_new_tokens the budget comes from self.budget when adaptive
+        budgets are on, otherwise it is 256.
+        `cancel` is a callable polled between tokens; once it returns True the
+        model stops and CancelledError is raised (unless other callers joined
+        this one, in which case it runs on for them)."""
+        lang = canonical_name(lang) or lang  # "py" and "Python" share caches, stopping rules and the fallback
+        best_of = self.best_of if best_of is None else best_of
+        max_new_tokens, adaptive = self._resolve_budget(description, mode, lang, max_new_tokens)
+        if self.inflight is None:
+            return self._generate(description, mode, lang, max_new_tokens, best_of, cancel, adaptive)
 
-        # Generate raw code (handle both real model and DummyModel signatures)
-        try:
-            raw = self.model.generate(prompt, max_new_tokens=max_new_tokens, temperature=0.0, top_p=1.0)
-        except TypeError:
-            raw = self.model.generate(prompt)
+        start = time.perf_counter()
+        key = (description, mode, lang, self._key_budget(max_new_tokens, adaptive), best_of)
+        requested = cancel
+        if cancel is not None:
 
-        # Post-process: sanitize, format, validate
-        try:
-            formatted, valid, msg = postprocess_and_format(raw, lang=lang)
-        except Exception:
-            formatted, valid, msg = raw, False, "Postprocess error"
+            def cancel():
+                # a leader keeps going while joined callers still want the result
+                return requested() and not self.inflight.waiting(key)
+        result, leader = self.inflight.do(
+            key,
+            lambda: self._generate(description, mode, lang, max_new_tokens, best_of, cancel, adaptive),
+            timeout=timeout, cancel=requested,
+        )
+        if not leader:
+            # a private copy of the leader's result; metrics describe this caller's wait
+            result["metrics"] = dict(result.get("metrics", {}), path="coalesced",
+                                     total_ms=round((time.perf_counter() - start) * 1000, 3))
+            emit(dict(result["metrics"], lang=lang, mode=mode))
+        return result
 
-        # If sanitizer removed everything or validation failed, make deterministic fallback for python
-        if (not formatted) or (lang == "python" and not valid):
-            import ast
+    def _generate(self, description, mode, lang, max_new_tokens, best_of, cancel=None, adaptive=False):
+        if self.replicas > 1:
+            # a learned budget is left to the replica, which keys and records it itself
+            result = self._get_pool().run("generate", description, mode=mode, lang=lang,
+                                          max_new_tokens=None if adaptive else max_new_tokens, best_of=best_of,
+                                          cancel=cancel)
+            emit(dict(result.get("metrics", {}), lang=lang, mode=mode))
+            return result
 
-            # infer a simple function name
-            fname = None
-            m = re.search(r"def\s+([A-Za-z_]\w*)\s*\(", description)
-            if m:
-                fname = m.group(1)
-            else:
-                m2 = re.search(r"named\s+([A-Za-z_]\w*)", description)
-                if m2:
-                    fname = m2.group(1)
-            if not fname:
-                m3 = re.search(r"function\s+that\s+([a-zA-Z ]+)", description, flags=re.I)
-                if m3:
-                    words = re.sub(r"[^a-zA-Z ]", "", m3.group(1)).strip().split()
-                    if words:
-                        fname = words[0]
-            if not fname:
-                fname = "generated_function"
-
-            # detect number of args heuristically
-            args = ["a", "b"]
-            m_args = re.search(r"takes\s+(\d+)\s+arguments|takes\s+(\d+)\s+parameters", description, flags=re.I)
-            if m_args:
+        trace = Trace()
+        with trace.stage("prompt"):
+            prompt = self._build_prompt(description, mode=mode, lang=lang)
+        # sampled results are keyed apart from greedy ones
+        label, cache_mode = self._model_label(), mode if best_of <= 1 else f"{mode}:best_of={best_of}"
+        key = self._cache_key(prompt, cache_mode, lang, self._key_budget(max_new_tokens, adaptive))
+        if key is not None:
+            with trace.stage("cache"):
+                cached = self.cache.get(key)
+            if cached is not None:
+                trace.path = "cache"
+                return self._observe(cached, trace, lang, mode)
+
+        namespace, hit = None, None
+        plugin = get_language(lang)
+        if self.similar is not None and best_of <= 1 and plugin is not None:
+            namespace = (label, lang, mode, self._key_budget(max_new_tokens, adaptive))
+            with trace.stage("similar"):
+                hit = self.similar.get(namespace, description, plugin.validate)
+            if hit is not None and not self.similar.should_audit():
+                trace.path = "similar"
+                result = dict(hit["result"], prompt=description,
+                              similar={"similarity": hit["similarity"], "matched": hit["matched"]})
+                return self._observe(result, trace, lang, mode)
+
+        with trace.stage("load"):
+            model = self.model
+        if self._model_label() != label:
+            # loading fell back to another model (DummyModel): store under the label of the one that runs
+            key = self._cache_key(prompt, cache_mode, lang, self._key_budget(max_new_tokens, adaptive))
+            if namespace is not None:
+                namespace = (self._model_label(),) + namespace[1:]
+        if best_of > 1 and hasattr(model, "generate_candidates"):
+            result, gen_stats = self._generate_best_of(model, description, prompt, mode, lang, max_new_tokens,
+                                                       best_of, trace, cancel)
+        else:
+            # Generate raw code (handle both real model and DummyModel signatures)
+            with trace.stage("model"):
+                extra = {"cancel": cancel} if cancel is not None else {}
                 try:
-                    n = int(m_args.group(1) or m_args.group(2))
-                    args = [f"arg{i+1}" for i in range(max(1, n))]
-                except Exception:
-                    args = ["a", "b"]
-
-            # choose body based on keywords
-            if re.search(r"add|sum|plus|total", description, flags=re.I):
-                if len(args) >= 2:
-                    body = f"return {args[0]} + {args[1]}"
-                else:
-                    body = f"return {args[0]}"
-            elif re.search(r"factorial", description, flags=re.I):
-                a0 = args[0]
-                body = (
-                    f"if {a0} < 2:\n"
-                    f"        return 1\n"
-                    f"    result = 1\n"
-                    f"    for i in range(2, {a0}+1):\n"
-                    f"        result *= i\n"
-                    f"    return result"
-                )
+                    raw = model.generate(prompt, max_new_tokens=max_new_tokens, temperature=0.0, top_p=1.0,
+                                         lang=lang, mode=mode, prefix=self._prompt_prefix(mode=mode, lang=lang),
+                                         **extra)
+                except TypeError:
+                    raw = model.generate(prompt)
+            if cancel is not None and cancel():
+                raise CancelledError("generation cancelled")
+            gen_stats = self._generation_stats()
+            result = self._finalize(description, raw, lang=lang, trace=trace)
+            result = self._record_budget(description, raw, result, trace, lang, mode,
+                                         max_new_tokens if adaptive else None, gen_stats[0] if gen_stats else None)
+        if key is not None and self._cacheable(result, trace, adaptive):
+            self.cache.put(key, result)
+        if namespace is not None:
+            if hit is not None:
+                self.similar.record_audit(description, hit, result)
+            # fallback stubs are built from this exact description, so they are never shared
+            if result.get("valid") and trace.path != "fallback":
+                self.similar.put(namespace, description, result)
+        return self._observe(result, trace, lang, mode, gen_stats[0] if gen_stats else None)
+
+    def _generate_best_of(self, model, description, prompt, mode, lang, max_new_tokens, n, trace, cancel=None):
+        # one sampling call for all candidates (the prompt is prefilled once), then parallel
+        # post-processing that stops as soon as one candidate validates
+        with trace.stage("model"):
+            extra = {"cancel": cancel} if cancel is not None else {}
+            raws = model.generate_candidates(prompt, n=n, max_new_tokens=max_new_tokens, lang=lang, mode=mode,
+                                             **extra)
+        if cancel is not None and cancel():
+            raise CancelledError("generation cancelled")
+        gen_stats = self._generation_stats()
+        with trace.stage("postprocess"):
+            index, processed, evaluated = postprocess_best(raws, lang=lang)
+        result = dict(self._finalize(description, raws[index], lang=lang, processed=processed, trace=trace))
+        result["best_of"] = {"n": n, "chosen": index, "evaluated": evaluated}
+        if gen_stats:
+            # candidates share the prompt; output tokens count everything decoded for all of them
+            gen_stats = [dict(gen_stats[min(index, len(gen_stats) - 1)],
+                              new_tokens=sum(s.get("new_tokens") or 0 for s in gen_stats))]
+        return result, gen_stats
+
+    def generate_stream(self, description, mode="function", lang="python", max_new_tokens=None):
+        """Stream a generation as it is decoded.
+
+        Yields {"event": "token", "text": chunk, "code": new_code} dicts while the
+        model runs, where `code` is the incrementally sanitized preview, then one
+        {"event": "done", "result": {...}} carrying the same dict generate() returns.
+        Formatting and validation only run once, on the complete output."""
+
+        lang = canonical_name(lang) or lang
+        max_new_tokens, adaptive = self._resolve_budget(description, mode, lang, max_new_tokens)
+        trace = Trace()
+        with trace.stage("prompt"):
+            prompt = self._build_prompt(description, mode=mode, lang=lang)
+        label = self._model_label()
+        key = self._cache_key(prompt, mode, lang, self._key_budget(max_new_tokens, adaptive))
+        if key is not None:
+            with trace.stage("cache"):
+                cached = self.cache.get(key)
+            if cached is not None:
+                trace.path = "cache"
+                yield {"event": "token", "text": cached["formatted_code"], "code": cached["formatted_code"]}
+                yield {"event": "done", "result": self._observe(cached, trace, lang, mode)}
+                return
+
+        with trace.stage("load"):
+            model = self.model
+        if self._model_label() != label:
+            key = self._cache_key(prompt, mode, lang, self._key_budget(max_new_tokens, adaptive))
+        sanitizer = IncrementalSanitizer()
+        if hasattr(model, "generate_stream"):
+            # streams carry only the completion; give sanitize_code the same input generate() would
+            if getattr(model, "echoes_prompt", False):
+                sanitizer.feed(prompt)
+            chunks = model.generate_stream(prompt, max_new_tokens=max_new_tokens, temperature=0.0, top_p=1.0,
+                                                lang=lang, mode=mode, prefix=self._prompt_prefix(mode=mode, lang=lang))
+        else:
+            try:
+                chunks = [model.generate(prompt, max_new_tokens=max_new_tokens, temperature=0.0, top_p=1.0,
+                                         lang=lang, mode=mode)]
+            except TypeError:
+                chunks = [model.generate(prompt)]
+
+        model_start = time.perf_counter()
+        for chunk in chunks:
+            trace.add("model", time.perf_counter() - model_start)
+            yield {"event": "token", "text": chunk, "code": sanitizer.feed(chunk)}
+            model_start = time.perf_counter()
+        trace.add("model", time.perf_counter() - model_start)
+        raw = sanitizer.raw
+        # flush a trailing line without newline into the preview as well; the result uses the raw output
+        if not raw.endswith("\n"):
+            tail = sanitizer.feed("\n")
+            if tail:
+                yield {"event": "token", "text": "", "code": tail}
+
+        gen_stats = self._generation_stats()
+        result = self._finalize(description, raw, lang=lang, trace=trace)
+        result = self._record_budget(description, raw, result, trace, lang, mode,
+                                     max_new_tokens if adaptive else None, gen_stats[0] if gen_stats else None)
+        if key is not None and self._cacheable(result, trace, adaptive):
+            self.cache.put(key, result)
+        yield {"event": "done", "result": self._observe(result, trace, lang, mode, gen_stats[0] if gen_stats else None)}
+
+    def generate_batch(self, descriptions, mode="function", lang="python", max_new_tokens=None, batch_size=8,
+                       cancel=None):
+        """Like generate() for a list of descriptions; results come back in input order.
+
+        Models exposing generate_batch run one forward pass per micro-batch of
+        `batch_size` prompts, anything else is called once per prompt. With
+        learned budgets (no max_new_tokens), items are sorted by predicted length
+        so each micro-batch decodes only as far as its own longest budget.
+        `cancel` works as in generate() and aborts the whole batch."""
+
+        lang = canonical_name(lang) or lang
+        descriptions = list(descriptions)
+        if self.replicas > 1:
+            # one micro-batch per job so idle replicas pick up the next one
+            chunks = [(descriptions[i:i + batch_size],) for i in range(0, len(descriptions), batch_size)]
+            results = [r for chunk in self._get_pool().map("generate_batch", chunks, mode=mode, lang=lang,
+                                                           max_new_tokens=max_new_tokens, batch_size=batch_size,
+                                                           cancel=cancel)
+                       for r in chunk]
+            for r in results:
+                emit(dict(r.get("metrics", {}), lang=lang, mode=mode))
+            return results
+        traces = [Trace() for _ in descriptions]
+        prompts = []
+        for d, trace in zip(descriptions, traces):
+            with trace.stage("prompt"):
+                prompts.append(self._build_prompt(d, mode=mode, lang=lang))
+        budgets = [self._resolve_budget(d, mode, lang, max_new_tokens) for d in descriptions]
+        label = self._model_label()
+        keys = [self._cache_key(p, mode, lang, self._key_budget(b, adaptive))
+                for p, (b, adaptive) in zip(prompts, budgets)]
+
+        results = [None] * len(descriptions)
+        pending = []
+        for i, key in enumerate(keys):
+            if key is not None:
+                with traces[i].stage("cache"):
+                    results[i] = self.cache.get(key)
+            if results[i] is None:
+                pending.append(i)
             else:
-                body = "return None"
+                traces[i].path = "cache"
+                results[i] = self._observe(results[i], traces[i], lang, mode)
+        if not pending:
+            return results
 
-            arg_list = ", ".join(args)
-            fallback = f"def {fname}({arg_list}):\n    {body}\n"
+        if any(adaptive for _, adaptive in budgets):
+            pending.sort(key=lambda i: budgets[i][0])
+            step = max(1, batch_size)
+            groups = [pending[k:k + step] for k in range(0, len(pending), step)]
+        else:
+            groups = [pending]
+        load_start = time.perf_counter()
+        model = self.model
+        load_s = time.perf_counter() - load_start
+        if self._model_label() != label:
+            keys = [self._cache_key(p, mode, lang, self._key_budget(b, adaptive))
+                    for p, (b, adaptive) in zip(prompts, budgets)]
+        model_start = time.perf_counter()
+        raws, gen_stats, used = [], [], {}
+        for group in groups:
+            if cancel is not None and cancel():
+                break
+            group_budget = max(budgets[i][0] for i in group)
+            raws += self._model_batch(model, [prompts[i] for i in group], group_budget, batch_size, lang, mode,
+                                      cancel)
+            stats = self._generation_stats()
+            gen_stats += stats + [None] * (len(group) - len(stats))
+            used.update((i, group_budget) for i in group)
+        model_s = time.perf_counter() - model_start
+        if cancel is not None and cancel():
+            raise CancelledError("generation cancelled")
+        post_start = time.perf_counter()
+        processed = postprocess_many(raws, lang=lang)
+        post_s = time.perf_counter() - post_start
+
+        # model and post-processing run batched, so each item is charged an equal share
+        for n, (i, raw) in enumerate(zip(pending, raws)):
+            traces[i].add("load", load_s / len(pending))
+            traces[i].add("model", model_s / len(pending))
+            traces[i].add("postprocess", post_s / len(pending))
+            results[i] = self._finalize(descriptions[i], raw, lang=lang, processed=processed[n], trace=traces[i])
+            results[i] = self._record_budget(descriptions[i], raw, results[i], traces[i], lang, mode,
+                                             used[i] if budgets[i][1] else None, gen_stats[n])
+            if keys[i] is not None and self._cacheable(results[i], traces[i], budgets[i][1]):
+                self.cache.put(keys[i], results[i])
+            results[i] = self._observe(results[i], traces[i], lang, mode, gen_stats[n])
+        return results
 
-            # try formatting fallback
+    def _model_batch(self, model, prompts, max_new_tokens, batch_size, lang, mode, cancel=None):
+        extra = {"cancel": cancel} if cancel is not None else {}
+        if hasattr(model, "generate_batch"):
+            return model.generate_batch(
+                prompts, max_new_tokens=max_new_tokens, temperature=0.0, top_p=1.0, batch_size=batch_size,
+                lang=lang, mode=mode, **extra,
+            )
+        raws = []
+        for prompt in prompts:
+            if cancel is not None and cancel():
+                break
             try:
-                formatted_fallback = format_python(fallback)
+                raws.append(model.generate(prompt, max_new_tokens=max_new_tokens, temperature=0.0, top_p=1.0,
+                                           lang=lang, mode=mode))
+            except TypeError:
+                raws.append(model.generate(prompt))
+        return raws
+
+    async def agenerate(self, description, mode="function", lang="python", max_new_tokens=None, best_of=None,
+                        timeout=None):
+        """Coroutine version of generate().
+
+        Runs on the generator's own thread pool (max_concurrency workers, queued
+        beyond that). `timeout` is a deadline in seconds for the whole call,
+        including time spent queued. On timeout or cancellation of the awaiting
+        task, token generation itself is stopped, not just abandoned.
+        """
+        cancelled = threading.Event()
+        fut = self._get_executor().submit(self.generate, description, mode, lang, max_new_tokens, best_of,
+                                          timeout, cancelled.is_set)
+        return await self._await_cancellable(fut, cancelled, timeout)
+
+    async def agenerate_batch(self, descriptions, mode="function", lang="python", max_new_tokens=None, batch_size=8,
+                              timeout=None):
+        """Coroutine version of generate_batch(), with the same deadline and cancellation rules as agenerate()."""
+        cancelled = threading.Event()
+        fut = self._get_executor().submit(self.generate_batch, list(descriptions), mode, lang, max_new_tokens,
+                                          batch_size, cancelled.is_set)
+        return await self._await_cancellable(fut, cancelled, timeout)
+
+    async def _await_cancellable(self, fut, cancelled, timeout):
+        import asyncio
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(fut), timeout)
+        except BaseException:
+            # deadline passed or the caller was cancelled: a queued job is dropped by the
+            # wrapped future's cancel(), a running one sees the flag at its next token
+            cancelled.set()
+            raise
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=max(1, self.max_concurrency),
+                                                    thread_name_prefix="codegen")
+            return self._executor
+
+    def _observe(self, result, trace, lang, mode, gen_stats=None):
+        """Attach per-stage metrics (and model generation stats) to a result and emit them to hooks."""
+        result = dict(result)
+        if gen_stats:
+            result["generation"] = gen_stats
+            trace.input_tokens = gen_stats.get("prompt_tokens")
+            trace.output_tokens = gen_stats.get("new_tokens")
+            for stage in ("tokenize", "prefill", "decode"):
+                if f"{stage}_s" in gen_stats:
+                    trace.add(stage, gen_stats[f"{stage}_s"])
+        result["metrics"] = trace.as_dict()
+        emit(dict(result["metrics"], lang=lang, mode=mode))
+        return result
+
+    def _get_pool(self):
+        if self._pool is None:
+            from generator.replicas import ReplicaPool
+            shared = None
+            model = self.model
+            if USE_REAL_MODEL and isinstance(model, CodeGenModel) and model.device == "cpu" and model.dtype != "int8":
+                # replicas map these weights from shared memory instead of loading their own copy; dynamically
+                # quantized weights are packed params that cannot be shared, so int8 replicas quantize their own
+                shared = {"model": model.model, "tokenizer": model.tokenizer, "model_name": model.model_name,
+                          "device": model.device, "dtype": model.dtype}
+            self._pool = ReplicaPool(
+                type(self), self.replicas, shared=shared,
+                factory_kwargs={"model_name": self.model_name, "device": self.device, "dtype": self.dtype,
+                                "replicas": 0},
+            )
+        return self._pool
+
+    def close(self):
+        """Stop replica processes and the async executor, if any were started, and save learned budgets."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self.budget is not None:
+            self.budget.save()
+
+    def _generation_stats(self):
+        # per-row {new_tokens, tokens_saved, stop_reason} from models that support early stopping
+        if hasattr(self.model, "last_generation_stats"):
+            return self.model.last_generation_stats()
+        return []
+
+    def _model_label(self):
+        # the configured name until the model is loaded, so a cache hit skips loading
+        # entirely; DummyModel has no model_name and never aliases a real model
+        model = self._model
+        return self.model_name if model is None else getattr(model, "model_name", type(model).__name__)
+
+    def _resolve_budget(self, description, mode, lang, max_new_tokens):
+        """(max_new_tokens, adaptive): the caller's value, else a learned budget, else the fixed default."""
+        if max_new_tokens is not None:
+            return max_new_tokens, False
+        if self.budget is None:
+            return DEFAULT_MAX_NEW_TOKENS, False
+        return self.budget.predict(self._model_label(), lang, mode, description), True
+
+    @staticmethod
+    def _key_budget(max_new_tokens, adaptive):
+        # a learned budget moves as samples arrive, so cache, coalescing and similarity keys name the policy
+        return "adaptive" if adaptive else max_new_tokens
+
+    @staticmethod
+    def _cacheable(result, trace, adaptive):
+        # a post-processing failure says nothing about the output, so it is never stored; under a learned
+        # budget a rejected output may just have been cut short, and the grown budget retries it
+        if trace.postprocess_error:
+            return False
+        return not adaptive or (bool(result.get("valid")) and trace.path != "fallback")
+
+    def _count_tokens(self, text):
+        tokenizer = getattr(self._model, "tokenizer", None)
+        if tokenizer is not None:
+            try:
+                return len(tokenizer.encode(text, add_special_tokens=False))
             except Exception:
-                formatted_fallback = fallback
+                pass
+        return len(text) // 4  # DummyModel's ~4 characters per token
+
+    def _record_budget(self, description, raw, result, trace, lang, mode, budget, gen_stats):
+        """Note an output's length with self.budget; returns `result`, marked not valid if it may be cut off.
 
-            # validate fallback strictly
+        Budgets are learned from the code that survives sanitizing, not from
+        the raw completion. Only a parser (validation_cost >= 1, within
+        VALIDATION_BUDGET) rejects code that was cut off, so output of other
+        languages that used up its learned `budget` counts as truncated."""
+        if self.budget is None:
+            return result
+        gen_stats = gen_stats or {}
+        new_tokens = gen_stats.get("new_tokens")
+        if new_tokens is None:
+            new_tokens = self._count_tokens(raw)  # models without stats return only the completion
+        plugin = get_language(lang)
+        parsed = lang == "python" or (plugin is not None and 1 <= plugin.validation_cost <= VALIDATION_BUDGET)
+        if budget is not None and new_tokens >= budget and not parsed and result.get("valid"):
+            result = dict(result, valid=False,
+                          validation_msg=f"Output reached the learned budget of {budget} tokens and may be cut off")
+        self.budget.record(self._model_label(), lang, mode, description, self._count_tokens(sanitize_code(raw)),
+                           budget=budget, new_tokens=new_tokens, decode_s=gen_stats.get("decode_s"),
+                           accepted=bool(result.get("valid")) and trace.path != "fallback")
+        return result
+
+    def _cache_key(self, prompt, mode, lang, max_new_tokens):
+        if self.cache is None:
+            return None
+        return make_key(self._model_label(), prompt, lang, mode, max_new_tokens, self._precision())
+
+    def _precision(self):
+        # canonical name, so "bf16" and "bfloat16" share cache entries
+        try:
+            return normalize_precision(self.dtype) if USE_REAL_MODEL else self.dtype
+        except ValueError:
+            return self.dtype  # loading rejects it and falls back to DummyModel
+
+    def _finalize(self, description, raw, lang="python", processed=None, trace=None):
+        # Post-process: sanitize, format, validate (batch callers pass it precomputed)
+        if processed is not None:
+            formatted, valid, msg = processed
+        else:
             try:
-                ast.parse(formatted_fallback)
-                return {
-                    "prompt": description,
-                    "lang": lang,
-                    "formatted_code": formatted_fallback,
-                    "valid": True,
-                    "validation_msg": "Valid (fallback) Python code",
-                }
+                formatted, valid, msg = postprocess_and_format(raw, lang=lang, trace=trace)
             except Exception:
-                # if fallback invalid for any reason, return best-effort sanitized output
-                return {
-                    "prompt": description,
-                    "lang": lang,
-                    "formatted_code": formatted or raw,
-                    "valid": False,
-                    "validation_msg": "Fallback generation failed to produce valid code",
-                }
+                formatted, valid, msg = raw, False, "Postprocess error"
+        if trace is not None:
+            trace.path = "light_cleanup" if msg == "Valid after light cleanup" else "model"
+            trace.postprocess_error = msg == "Postprocess error"
+
+        # If sanitizer removed everything or validation failed, make deterministic fallback for python
+        if (not formatted) or (lang == "python" and not valid):
+            if trace is not None:
+                trace.path = "fallback"
+            with timed(trace, "fallback"):
+                return self._fallback(description, raw, formatted, lang)
 
         # Normal return: model output usable
         return {
@@ -212,6 +689,86 @@ class CodeGenerator:
             "validation_msg": msg,
         }
 
+    def _fallback(self, description, raw, formatted, lang="python"):
+        """Deterministic Python stub built from the description when model output is unusable."""
+        import ast
+
+        # infer a simple function name
+        fname = None
+        m = re.search(r"def\s+([A-Za-z_]\w*)\s*\(", description)
+        if m:
+            fname = m.group(1)
+        else:
+            m2 = re.search(r"named\s+([A-Za-z_]\w*)", description)
+            if m2:
+                fname = m2.group(1)
+        if not fname:
+            m3 = re.search(r"function\s+that\s+([a-zA-Z ]+)", description, flags=re.I)
+            if m3:
+                words = re.sub(r"[^a-zA-Z ]", "", m3.group(1)).strip().split()
+                if words:
+                    fname = words[0]
+        if not fname:
+            fname = "generated_function"
+
+        # detect number of args heuristically
+        args = ["a", "b"]
+        m_args = re.search(r"takes\s+(\d+)\s+arguments|takes\s+(\d+)\s+parameters", description, flags=re.I)
+        if m_args:
+            try:
+                n = int(m_args.group(1) or m_args.group(2))
+                args = [f"arg{i+1}" for i in range(max(1, n))]
+            except Exception:
+                args = ["a", "b"]
+
+        # choose body based on keywords
+        if re.search(r"add|sum|plus|total", description, flags=re.I):
+            if len(args) >= 2:
+                body = f"return {args[0]} + {args[1]}"
+            else:
+                body = f"return {args[0]}"
+        elif re.search(r"factorial", description, flags=re.I):
+            a0 = args[0]
+            body = (
+                f"if {a0} < 2:\n"
+                f"        return 1\n"
+                f"    result = 1\n"
+                f"    for i in range(2, {a0}+1):\n"
+                f"        result *= i\n"
+                f"    return result"
+            )
+        else:
+            body = "return None"
+
+        arg_list = ", ".join(args)
+        fallback = f"def {fname}({arg_list}):\n    {body}\n"
+
+        # try formatting fallback
+        try:
+            formatted_fallback = format_python(fallback)
+        except Exception:
+            formatted_fallback = fallback
+
+        # validate fallback strictly
+        try:
+            ast.parse(formatted_fallback)
+            return {
+                "prompt": description,
+                "lang": lang,
+                "formatted_code": formatted_fallback,
+                "valid": True,
+                "validation_msg": "Valid (fallback) Python code",
+            }
+        except Exception:
+            # if fallback invalid for any reason, return best-effort sanitized output
+            return {
+                "prompt": description,
+                "lang": lang,
+                "formatted_code": formatted or raw,
+                "valid": False,
+                "validation_msg": "Fallback generation failed to produce valid code",
+            }
+
 
 def run_demo():
     print(">>> Running demo generate (safe mode).")
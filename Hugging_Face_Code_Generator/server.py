@@ -0,0 +1,325 @@
+# server.py
+"""Long-running HTTP inference server around CodeGenerator.
+
+    python server.py --port 8000                 # real model (falls back to DummyModel)
+    python server.py --dummy --port 8000         # no weights, for offline load tests
+
+Endpoints:
+    POST /generate         {"description", "lang", "mode", "max_new_tokens"} -> result JSON
+    POST /generate/stream  same body -> newline-delimited JSON events (chunked)
+    GET  /health           status, queue depth and batching counters
+"""
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from main import CodeGenerator, DummyModel
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class PayloadTooLarge(ValueError):
+    """A request body over max_body (answered with 413; other ValueErrors while reading are 400)."""
+
+
+class BatchScheduler:
+    """Collects concurrent requests into model batches.
+
+    A batch closes when max_batch requests are waiting or max_wait_ms has passed
+    since the first one arrived. Requests are grouped by (lang, mode,
+    max_new_tokens), run through CodeGenerator.generate_batch on a single model
+    thread, and each caller's future gets its own result. Streamed requests
+    (stream()) are not batched but run on the same model thread, one at a time
+    between batches. Queued and streaming requests together are bounded by
+    max_queue: past it, submit() and stream() raise asyncio.QueueFull so
+    callers can shed load.
+    """
+
+    def __init__(self, generator, max_batch: int = 8, max_wait_ms: float = 5.0, max_queue: int = 256):
+        self.generator = generator
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model")
+        self.streaming = 0  # streams accepted and not finished
+        self.stats = {"requests": 0, "batches": 0, "streams": 0, "rejected": 0, "max_batch_seen": 0}
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        self.executor.shutdown(wait=False)
+
+    def _check_capacity(self):
+        if self.queue.qsize() + self.streaming >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise asyncio.QueueFull
+
+    def submit(self, description, lang, mode, max_new_tokens):
+        self._check_capacity()
+        fut = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((description, lang, mode, max_new_tokens, fut))
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            raise
+        self.stats["requests"] += 1
+        return fut
+
+    def stream(self, description, lang, mode, max_new_tokens, emit):
+        """Run generate_stream on the model thread, calling emit(event) there for every event.
+
+        Returns an asyncio future that completes when the stream has ended."""
+        self._check_capacity()
+        self.streaming += 1
+        self.stats["streams"] += 1
+
+        def produce():
+            for event in self.generator.generate_stream(description, mode=mode, lang=lang,
+                                                        max_new_tokens=max_new_tokens):
+                emit(event)
+
+        def done(_):
+            self.streaming -= 1
+
+        fut = asyncio.get_running_loop().run_in_executor(self.executor, produce)
+        fut.add_done_callback(done)
+        return fut
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _run_batch(self, batch):
+        groups = {}
+        for item in batch:
+            groups.setdefault(item[1:4], []).append(item)
+        out = []
+        for (lang, mode, max_new_tokens), items in groups.items():
+            try:
+                results = self.generator.generate_batch([i[0] for i in items], mode=mode, lang=lang,
+                                                        max_new_tokens=max_new_tokens, batch_size=len(items))
+                out += [(i[4], r, None) for i, r in zip(items, results)]
+            except Exception as e:
+                out += [(i[4], None, e) for i in items]
+        return out
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            self.stats["batches"] += 1
+            self.stats["max_batch_seen"] = max(self.stats["max_batch_seen"], len(batch))
+            for fut, result, error in await loop.run_in_executor(self.executor, self._run_batch, batch):
+                if fut.done():  # caller went away
+                    continue
+                if error is not None:
+                    fut.set_exception(error)
+                else:
+                    fut.set_result(result)
+
+
+class CodeGenServer:
+    def __init__(self, generator, scheduler, max_body: int = 1 << 20):
+        self.generator = generator
+        self.scheduler = scheduler
+        self.max_body = max_body
+        self.started = time.time()
+
+    async def _send(self, writer, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}", "Content-Type: application/json",
+                f"Content-Length: {len(body)}"] + [f"{k}: {v}" for k, v in (headers or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, path, _ = line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise ValueError("malformed request line") from None
+        headers = {}
+        while True:
+            h = await reader.readline()
+            if h in (b"\r\n", b"\n", b""):
+                break
+            k, _, v = h.decode("latin-1").partition(":")
+            headers[k.strip().lower()] = v.strip()
+        try:
+            length = int(headers.get("content-length", "0") or 0)
+        except ValueError:
+            raise ValueError("invalid Content-Length") from None
+        if length < 0:
+            raise ValueError("invalid Content-Length")
+        if length > self.max_body:
+            raise PayloadTooLarge("payload too large")
+        body = await reader.readexactly(length) if length else b""
+        return method, path.split("?", 1)[0], headers, body
+
+    def _parse_job(self, body):
+        data = json.loads(body or b"{}")
+        if not isinstance(data, dict):
+            raise ValueError("request body must be a JSON object")
+        if not data.get("description"):
+            raise ValueError("'description' is required")
+        # no max_new_tokens: the generator's default (a learned budget when adaptive budgets are on)
+        max_new_tokens = data.get("max_new_tokens")
+        return (data["description"], data.get("lang", "python"), data.get("mode", "function"),
+                int(max_new_tokens) if max_new_tokens is not None else None)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    req = await self._read_request(reader)
+                except PayloadTooLarge as e:
+                    await self._send(writer, 413, {"error": str(e)})
+                    break
+                except ValueError as e:  # unparseable request line or headers
+                    await self._send(writer, 400, {"error": str(e)})
+                    break
+                if req is None:
+                    break
+                method, path, headers, body = req
+                if path == "/health":
+                    await self._send(writer, 200, self.health())
+                elif path in ("/generate", "/generate/stream"):
+                    if method != "POST":
+                        await self._send(writer, 405, {"error": "use POST"})
+                    else:
+                        try:
+                            job = self._parse_job(body)
+                        except (ValueError, TypeError) as e:
+                            await self._send(writer, 400, {"error": str(e)})
+                        else:
+                            if path == "/generate":
+                                await self._generate(writer, job)
+                            else:
+                                await self._stream(writer, job)
+                                break  # chunked stream ends the connection
+                else:
+                    await self._send(writer, 404, {"error": f"unknown path {path}"})
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _generate(self, writer, job):
+        try:
+            fut = self.scheduler.submit(*job)
+        except asyncio.QueueFull:
+            await self._send(writer, 503, {"error": "server busy"}, {"Retry-After": "1"})
+            return
+        try:
+            result = await fut
+        except Exception as e:
+            await self._send(writer, 500, {"error": f"generation failed: {e}"})
+            return
+        await self._send(writer, 200, result)
+
+    async def _stream(self, writer, job):
+        # streams are not batched, but share the model thread and the queue bound with batched requests;
+        # tokens are pushed from the model thread as they arrive
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+
+        def emit(event):
+            loop.call_soon_threadsafe(events.put_nowait, event)
+
+        def finished(fut):
+            if not fut.cancelled() and fut.exception() is not None:
+                events.put_nowait({"event": "error", "error": str(fut.exception())})
+            events.put_nowait(None)
+
+        try:
+            fut = self.scheduler.stream(*job, emit)
+        except asyncio.QueueFull:
+            await self._send(writer, 503, {"error": "server busy"}, {"Retry-After": "1"})
+            return
+        fut.add_done_callback(finished)
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                     b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+        while True:
+            event = await events.get()
+            if event is None:
+                break
+            data = (json.dumps(event) + "\n").encode("utf-8")
+            writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    def health(self):
+        model = self.generator._model
+        return {
+            "status": "ok",
+            "model": getattr(model, "model_name", type(model).__name__ if model is not None else None),
+            "queue_depth": self.scheduler.queue.qsize(),
+            "uptime_s": round(time.time() - self.started, 1),
+            "batching": dict(self.scheduler.stats),
+            "coalescing": dict(self.generator.inflight.stats) if self.generator.inflight is not None else None,
+            "similarity": self.generator.similar.report() if self.generator.similar is not None else None,
+            "budget": self.generator.budget.report() if self.generator.budget is not None else None,
+        }
+
+
+async def serve(host="127.0.0.1", port=8000, max_batch=8, max_wait_ms=5.0, max_queue=256, dummy=False,
+                generator=None, ready=None):
+    generator = generator or CodeGenerator()
+    if dummy:
+        generator.model = DummyModel()
+    else:
+        generator.model  # load once, before accepting traffic
+    scheduler = BatchScheduler(generator, max_batch=max_batch, max_wait_ms=max_wait_ms, max_queue=max_queue)
+    scheduler.start()
+    app = CodeGenServer(generator, scheduler)
+    server = await asyncio.start_server(app.handle, host, port)
+    print(f"Serving on http://{host}:{server.sockets[0].getsockname()[1]} "
+          f"(max_batch={max_batch}, max_wait_ms={max_wait_ms}, max_queue={max_queue})")
+    if ready is not None:
+        ready(server)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await scheduler.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CodeGen HTTP inference server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch", type=int, default=8, help="largest dynamic batch")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0, help="how long a batch may wait to fill")
+    parser.add_argument("--max-queue", type=int, default=256, help="pending requests before returning 503")
+    parser.add_argument("--dummy", action="store_true", help="serve DummyModel (no weights needed)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.max_batch, args.max_wait_ms, args.max_queue, args.dummy))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()